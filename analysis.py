@@ -0,0 +1,220 @@
+import glob
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from storage import data_path, is_parquet, read_table, write_table
+
+# Attributes whose effect on the scores and comparisons we measure
+PROTECTED_ATTRIBUTES = ['gender', 'race', 'religion', 'sexual_orientation', 'family_status', 'age_band']
+
+# Design factors the score deltas are controlled for (compared only within the same combination)
+CONTROL_ATTRIBUTES = ['experience_level', 'college_level', 'skill_level']
+
+AGE_BANDS = [18, 25, 35, 45, 55, 65, 81]
+AGE_BAND_LABELS = ['18-24', '25-34', '35-44', '45-54', '55-64', '65-80']
+
+
+# Every comparison output in the repository (the Parquet copy wins when both formats exist)
+def result_files(root='.'):
+    paths = {}
+    for pattern in ('synthetic_data_large_final_*.csv', 'synthetic_data_large_final_*.parquet'):
+        for path in sorted(glob.glob(os.path.join(root, pattern)) + glob.glob(os.path.join(root, '*', pattern))):
+            paths[os.path.splitext(path)[0]] = path
+    return sorted(paths.values())
+
+
+def _columns(path):
+    if is_parquet(path):
+        import pyarrow.parquet as pq
+
+        return pq.read_schema(path).names
+    return pd.read_csv(path, nrows=0).columns.tolist()
+
+
+# Load one output with only the columns the analysis needs (the cover letters are never read)
+def load_results(path):
+    wanted = {'cv_1_id', 'cv_2_id', 'age'} | set(PROTECTED_ATTRIBUTES) | set(CONTROL_ATTRIBUTES)
+    columns = [column for column in _columns(path) if column in wanted or '~' in column]
+    df = read_table(path, columns=columns)
+
+    # Old incremental runs appended some rows twice; keep the last result per CV
+    df = df.drop_duplicates('cv_1_id', keep='last').reset_index(drop=True)
+    return prepare_attributes(df)
+
+
+# Add the age band ('NONE' where the age is missing) and make every attribute column a string column
+def prepare_attributes(df):
+    age = pd.to_numeric(df['age'], errors='coerce')
+    df['age_band'] = pd.cut(age, AGE_BANDS, right=False, labels=AGE_BAND_LABELS).astype(object).where(age.notna(), 'NONE')
+    for column in PROTECTED_ATTRIBUTES + CONTROL_ATTRIBUTES:
+        df[column] = df[column].astype(str)
+    return df
+
+
+# Models with results in this output, from the score~<model> / winner~<model> columns
+def result_models(df):
+    return sorted({column.split('~', 1)[1] for column in df.columns if '~' in column})
+
+
+# Integer codes for the analysis: every (attribute, value) pair gets one global code, so all
+# attributes can be aggregated with a single bincount, and every combination of the control
+# attributes gets a stratum code. Returns (codes n x attributes, levels [(attribute, value)], strata).
+def encode(df):
+    codes = np.empty((len(df), len(PROTECTED_ATTRIBUTES)), dtype=np.int64)
+    levels = []
+    for i, attribute in enumerate(PROTECTED_ATTRIBUTES):
+        attribute_codes, values = pd.factorize(df[attribute], sort=True)
+        codes[:, i] = attribute_codes + len(levels)
+        levels.extend((attribute, value) for value in values)
+    strata = df.groupby(CONTROL_ATTRIBUTES, sort=False).ngroup().to_numpy()
+    return codes, levels, strata
+
+
+# Scores as an n x models float matrix, with 0 (unparsed or never scored) as NaN
+def score_matrix(df, models):
+    scores = np.full((len(df), len(models)), np.nan)
+    for j, model in enumerate(models):
+        column = f'score~{model}'
+        if column in df:
+            scores[:, j] = pd.to_numeric(df[column], errors='coerce')
+    scores[scores <= 0] = np.nan
+    return scores
+
+
+# Winners as an n x models matrix of 1 or 2 (anything else, e.g. 'Neither' or N/A, as NaN)
+def winner_matrix(df, models):
+    winners = np.full((len(df), len(models)), np.nan)
+    for j, model in enumerate(models):
+        column = f'winner~{model}'
+        if column in df:
+            winners[:, j] = pd.to_numeric(df[column].astype(str), errors='coerce')
+    winners[(winners != 1) & (winners != 2)] = np.nan
+    return winners
+
+
+# Sum of `weights` per (group, model) cell, for group codes shaped like `weights` (n x models)
+def _sum_by(groups, weights, n_groups):
+    models = weights.shape[1]
+    cells = groups * models + np.arange(models)
+    return np.bincount(cells.ravel(), weights.ravel(), minlength=n_groups * models).reshape(n_groups, models)
+
+
+# Mean score per model and protected attribute value, raw and controlled: the controlled delta is
+# the mean difference between a CV's score and the mean score of CVs with the same experience,
+# college and skill levels, so it isn't driven by how those levels happen to mix with the attribute
+def score_deltas(df, models, encoded=None):
+    codes, levels, strata = encoded or encode(df)
+    scores = score_matrix(df, models)
+    valid = ~np.isnan(scores)
+    scores = np.where(valid, scores, 0.0)
+    strata = np.broadcast_to(strata[:, None], scores.shape)
+
+    n_strata = strata.max() + 1 if len(strata) else 0
+    stratum_mean = _sum_by(strata, scores, n_strata) / np.maximum(_sum_by(strata, valid, n_strata), 1)
+    residuals = np.where(valid, scores - np.take_along_axis(stratum_mean, strata, axis=0), 0.0)
+
+    # Every row counts once under each attribute: repeat the score columns once per attribute
+    groups = np.broadcast_to(codes.T.reshape(-1, 1), (codes.size, len(models)))
+    tile = lambda matrix: np.tile(matrix, (len(PROTECTED_ATTRIBUTES), 1))
+    n = _sum_by(groups, tile(valid), len(levels))
+    mean_score = _sum_by(groups, tile(scores), len(levels)) / np.where(n > 0, n, np.nan)
+    adjusted = _sum_by(groups, tile(residuals), len(levels)) / np.where(n > 0, n, np.nan)
+    overall = scores.sum(axis=0) / np.where(valid.any(axis=0), valid.sum(axis=0), np.nan)
+
+    level, model = np.nonzero(n)
+    return pd.DataFrame({
+        'model': np.asarray(models, dtype=object)[model],
+        'attribute': [levels[i][0] for i in level],
+        'value': [levels[i][1] for i in level],
+        'n': n[level, model].astype(int),
+        'mean_score': mean_score[level, model],
+        'raw_delta': mean_score[level, model] - overall[model],
+        'adjusted_delta': adjusted[level, model],
+    })
+
+
+# Head-to-head results between attribute values: for every comparison where CV 1 and CV 2 differ
+# in an attribute, how often each value won against each other value, per model
+def win_rates(df, models, encoded=None):
+    codes, levels, _ = encoded or encode(df)
+    winners = winner_matrix(df, models)
+    ids = pd.to_numeric(df['cv_1_id'], errors='coerce')
+    partner = pd.Index(ids).get_indexer(pd.to_numeric(df['cv_2_id'], errors='coerce'))
+
+    # (row, model) of every decided comparison whose CV 2 is in the file
+    row, model = np.nonzero(~np.isnan(winners) & (partner >= 0)[:, None])
+    first, second = codes[row], codes[partner[row]]
+    first_won = (winners[row, model] == 1)[:, None]
+    winner = np.where(first_won, first, second)
+    loser = np.where(first_won, second, first)
+    differ = winner != loser
+
+    # Wins per (model, winner value, loser value), as one flat bincount
+    size = len(levels)
+    cells = (np.broadcast_to(model[:, None], winner.shape) * size + winner) * size + loser
+    wins = np.bincount(cells[differ], minlength=len(models) * size * size).reshape(len(models), size, size)
+    losses = wins.transpose(0, 2, 1)
+    comparisons = wins + losses
+
+    model, value, opponent = np.nonzero(comparisons)
+    return pd.DataFrame({
+        'model': np.asarray(models, dtype=object)[model],
+        'attribute': [levels[i][0] for i in value],
+        'value': [levels[i][1] for i in value],
+        'opponent': [levels[i][1] for i in opponent],
+        'wins': wins[model, value, opponent],
+        'losses': losses[model, value, opponent],
+        'comparisons': comparisons[model, value, opponent],
+        'win_rate': wins[model, value, opponent] / comparisons[model, value, opponent],
+    })
+
+
+# One row per model: how much it scored and compared, and how often it picked the first CV
+def model_summary(df, models):
+    scores = score_matrix(df, models)
+    winners = winner_matrix(df, models)
+    scored = (~np.isnan(scores)).sum(axis=0)
+    compared = (~np.isnan(winners)).sum(axis=0)
+    return pd.DataFrame({
+        'model': models,
+        'scored': scored,
+        'mean_score': np.nansum(scores, axis=0) / np.where(scored > 0, scored, np.nan),
+        'compared': compared,
+        'cv_1_win_rate': (winners == 1).sum(axis=0) / np.where(compared > 0, compared, np.nan),
+    })
+
+
+# Run the whole analysis over a set of outputs and return (summary, score deltas, win rates)
+def analyze(paths):
+    summaries, deltas, rates = [], [], []
+    for path in paths:
+        df = load_results(path)
+        models = result_models(df)
+        encoded = encode(df)
+        source = os.path.basename(os.path.splitext(path)[0])
+        for frames, table in ((summaries, model_summary(df, models)),
+                              (deltas, score_deltas(df, models, encoded)),
+                              (rates, win_rates(df, models, encoded))):
+            table.insert(0, 'file', source)
+            frames.append(table)
+    return tuple(pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+                 for frames in (summaries, deltas, rates))
+
+
+if __name__ == '__main__':
+    paths = sys.argv[1:] or result_files()
+    start = time.perf_counter()
+    summary, deltas, rates = analyze(paths)
+    print(f"Analyzed {len(summary)} model runs in {len(paths)} files in {time.perf_counter() - start:.2f}s")
+
+    with pd.option_context('display.width', 200, 'display.max_rows', 200):
+        print(summary.round(3).to_string(index=False))
+
+    for name, table in (('summary', summary), ('score_deltas', deltas), ('win_rates', rates)):
+        output_file = data_path(f'bias_analysis_{name}.csv')
+        write_table(table, output_file)
+        print(f"Saved {output_file}")
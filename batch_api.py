@@ -0,0 +1,177 @@
+import json
+import os
+import time
+
+from run_log import get_logger
+
+log = get_logger('batch_api')
+
+# Limits of a single OpenAI batch input file
+MAX_REQUESTS_PER_FILE = 50000
+MAX_BYTES_PER_FILE = 190 * 1024 * 1024
+
+FINAL_STATUSES = ('completed', 'failed', 'expired', 'cancelled')
+
+
+# custom_id encodes where a result belongs, e.g. 'score|12|gpt-4o-2024-05-13'
+def make_custom_id(task, row, model):
+    return f"{task}|{row}|{model}"
+
+
+def parse_custom_id(custom_id):
+    task, row, model = custom_id.split('|', 2)
+    return task, int(row), model
+
+
+# One line of a batch input file in the OpenAI batch format
+def batch_line(custom_id, model, prompt, temperature=0.7, max_tokens=None, response_format=None):
+    body = {'model': model, 'messages': [{'role': 'user', 'content': prompt}], 'temperature': temperature}
+    if max_tokens is not None:
+        body['max_tokens'] = max_tokens
+    if response_format is not None:
+        body['response_format'] = response_format
+    return json.dumps({'custom_id': custom_id, 'method': 'POST', 'url': '/v1/chat/completions', 'body': body})
+
+
+# Write requests [(custom_id, model, prompt, temperature, response_format, max_tokens)] into JSONL
+# batch files, one model per file and split to stay under the per-file limits; returns the written paths
+def write_batch_files(requests_, prefix):
+    by_model = {}
+    for custom_id, model, prompt, temperature, response_format, max_tokens in requests_:
+        by_model.setdefault(model, []).append(
+            batch_line(custom_id, model, prompt, temperature, max_tokens, response_format))
+
+    paths = []
+    for model, lines in by_model.items():
+        part, count, size, f = 0, 0, 0, None
+        for line in lines:
+            if f is None or count >= MAX_REQUESTS_PER_FILE or size + len(line) + 1 > MAX_BYTES_PER_FILE:
+                if f is not None:
+                    f.close()
+                path = f"{prefix}.{model}.{part}.jsonl"
+                paths.append(path)
+                f = open(path, 'w', encoding='utf-8')
+                part, count, size = part + 1, 0, 0
+            f.write(line + '\n')
+            count += 1
+            size += len(line.encode('utf-8')) + 1
+        if f is not None:
+            f.close()
+    return paths
+
+
+# Minimal client for the files and batches endpoints; the base URL comes from openai.api_base
+# (OPENAI_API_BASE), so it can point at a local stand-in server such as fake_batch_server.py
+class BatchClient:
+    def __init__(self, api_key=None, api_base=None, session=None):
+        import openai
+        import requests
+
+        self.api_key = api_key or openai.api_key
+        self.api_base = (api_base or openai.api_base).rstrip('/')
+        self.session = session or requests.Session()
+        self.session.headers['Authorization'] = f"Bearer {self.api_key}"
+
+    def _check(self, response):
+        if response.status_code >= 400:
+            raise RuntimeError(f"Batch API error {response.status_code}: {response.text[:500]}")
+        return response
+
+    def upload(self, path):
+        with open(path, 'rb') as f:
+            response = self.session.post(f"{self.api_base}/files", data={'purpose': 'batch'},
+                                         files={'file': (os.path.basename(path), f, 'application/jsonl')})
+        return self._check(response).json()['id']
+
+    def create_batch(self, input_file_id, metadata=None):
+        payload = {'input_file_id': input_file_id, 'endpoint': '/v1/chat/completions', 'completion_window': '24h'}
+        if metadata:
+            payload['metadata'] = metadata
+        return self._check(self.session.post(f"{self.api_base}/batches", json=payload)).json()
+
+    def get_batch(self, batch_id):
+        return self._check(self.session.get(f"{self.api_base}/batches/{batch_id}")).json()
+
+    def file_content(self, file_id):
+        return self._check(self.session.get(f"{self.api_base}/files/{file_id}/content")).text
+
+
+# Tracks submitted batches in a small JSON state file so a restarted run resumes polling
+# instead of submitting the same requests again
+class BatchRun:
+    def __init__(self, state_file, client=None):
+        self.state_file = state_file
+        self.client = client or BatchClient()
+        self.state = {'batches': {}}
+        if os.path.exists(state_file):
+            with open(state_file, encoding='utf-8') as f:
+                self.state = json.load(f)
+
+    def _save(self):
+        tmp = self.state_file + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self.state, f, indent=1)
+        os.replace(tmp, self.state_file)
+
+    # custom_ids that are already in a submitted batch which hasn't been merged yet
+    def in_flight(self):
+        ids = set()
+        for batch in self.state['batches'].values():
+            if not batch.get('merged'):
+                ids.update(batch['custom_ids'])
+        return ids
+
+    # Write, upload and submit batch files for requests not already in flight
+    def submit(self, requests_, prefix):
+        in_flight = self.in_flight()
+        requests_ = [r for r in requests_ if r[0] not in in_flight]
+        if not requests_:
+            return []
+        submitted = []
+        for path in write_batch_files(requests_, prefix):
+            with open(path, encoding='utf-8') as f:
+                custom_ids = [json.loads(line)['custom_id'] for line in f]
+            file_id = self.client.upload(path)
+            batch = self.client.create_batch(file_id, metadata={'source': os.path.basename(path)})
+            self.state['batches'][batch['id']] = {'file': path, 'custom_ids': custom_ids, 'status': batch['status']}
+            self._save()
+            submitted.append(batch['id'])
+            log.info("Submitted batch %s with %d requests from %s", batch['id'], len(custom_ids), path)
+        return submitted
+
+    # Poll every unmerged batch until it is finished, calling on_result(custom_id, text) for each answer
+    def wait_and_merge(self, on_result, poll_interval=30):
+        while True:
+            pending = [batch_id for batch_id, b in self.state['batches'].items() if not b.get('merged')]
+            if not pending:
+                return
+            for batch_id in pending:
+                batch = self.client.get_batch(batch_id)
+                record = self.state['batches'][batch_id]
+                record['status'] = batch['status']
+                counts = batch.get('request_counts') or {}
+                log.info("Batch %s: %s (%s/%s done)", batch_id, batch['status'], counts.get('completed', 0),
+                         counts.get('total', '?'))
+                if batch['status'] not in FINAL_STATUSES:
+                    continue
+                if batch.get('output_file_id'):
+                    merged, failed = self._merge(batch['output_file_id'], on_result)
+                    log.info("Merged %d results from batch %s (%d failed requests)", merged, batch_id, failed)
+                record['merged'] = True
+                self._save()
+            if any(not b.get('merged') for b in self.state['batches'].values()):
+                time.sleep(poll_interval)
+
+    def _merge(self, output_file_id, on_result):
+        merged, failed = 0, 0
+        for line in self.client.file_content(output_file_id).splitlines():
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            response = item.get('response') or {}
+            if item.get('error') or response.get('status_code') != 200:
+                failed += 1
+                continue
+            on_result(item['custom_id'], response['body']['choices'][0]['message']['content'])
+            merged += 1
+        return merged, failed
@@ -0,0 +1,255 @@
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+from scipy import sparse, stats
+
+from analysis import encode, load_results, result_files, result_models, score_matrix, winner_matrix
+from storage import data_path, write_table
+
+RESAMPLES = 10000
+
+# Resamples drawn per batch; the largest array per batch is about CHUNK_SIZE x rows x models floats
+CHUNK_SIZE = 250
+
+# Design factors the bootstrap resamples and the permutations stay within
+STRATA = ['experience_level', 'college_level']
+
+
+# Stratum code per row (all rows in one stratum when no columns are given)
+def strata_codes(df, columns):
+    if not columns:
+        return np.zeros(len(df), dtype=np.int64)
+    return df.groupby(list(columns), sort=False).ngroup().to_numpy()
+
+
+# `size` x rows matrix of bootstrap row indices: each resample draws, with replacement, as many
+# rows from every stratum as the stratum has
+def bootstrap_indices(strata, size, rng):
+    order = np.argsort(strata, kind='stable')
+    sizes = np.bincount(strata)
+    starts = np.repeat(np.cumsum(sizes) - sizes, sizes)
+    picks = starts + (rng.random((size, len(strata))) * np.repeat(sizes, sizes)).astype(np.int64)
+    return order[picks]
+
+
+# `size` x rows matrix of permutations that only move rows within their stratum
+def permutation_indices(strata, size, rng):
+    order = np.argsort(strata, kind='stable')
+    shuffled = np.argsort(strata[order] + rng.random((size, len(strata))), axis=1)
+    permutations = np.empty((size, len(strata)), dtype=np.int64)
+    permutations[:, order] = order[shuffled]
+    return permutations
+
+
+# How many times each row was drawn, per resample
+def index_weights(indices, rows):
+    size = len(indices)
+    cells = (np.arange(size)[:, None] * rows + indices).ravel()
+    return np.bincount(cells, minlength=size * rows).reshape(size, rows).astype(float)
+
+
+# Percentile interval over the last axis
+def percentile_interval(samples, alpha):
+    with np.errstate(invalid='ignore'):
+        return np.nanpercentile(samples, [100 * alpha / 2, 100 * (1 - alpha / 2)], axis=-1)
+
+
+# Bootstrap of the score effects in analysis.score_deltas. Every sum the effects are built from is a
+# sum over rows, so for row weights W (resamples x rows) they are all in W @ X for one sparse X with
+# a column per (attribute value, control stratum, model) cell: valid scores, and their total.
+class ScoreEffects:
+    def __init__(self, df, models, encoded):
+        codes, self.levels, control = encoded
+        scores = score_matrix(df, models)
+        self.shape = (len(self.levels), control.max() + 1 if len(control) else 0, len(models))
+
+        row, model = np.nonzero(~np.isnan(scores))
+        attributes = codes.shape[1]
+        level = codes[row].T.ravel()
+        row, model = np.tile(row, attributes), np.tile(model, attributes)
+        keys, cell = np.unique(np.ravel_multi_index((level, control[row], model), self.shape), return_inverse=True)
+        self.cells = np.unravel_index(keys, self.shape)
+        self.attributes = attributes
+
+        counts = sparse.csr_matrix((np.ones(len(row)), (row, cell)), shape=(len(df), len(keys)))
+        totals = sparse.csr_matrix((scores[row, model], (row, cell)), shape=(len(df), len(keys)))
+        self.features = sparse.hstack([counts, totals]).T.tocsr()
+
+        # Permutation test data: residuals against the full-sample control stratum means
+        valid = ~np.isnan(scores)
+        filled = np.where(valid, scores, 0.0)
+        stratum_count = np.zeros(self.shape[1:])
+        stratum_total = np.zeros(self.shape[1:])
+        np.add.at(stratum_count, control, valid)
+        np.add.at(stratum_total, control, filled)
+        stratum_mean = stratum_total / np.maximum(stratum_count, 1)
+        self.residuals = np.hstack([np.where(valid, filled - stratum_mean[control], 0.0), valid])
+        indicator = np.ones(codes.size)
+        self.level_rows = sparse.csr_matrix((indicator, (codes.T.ravel(), np.tile(np.arange(len(df)), attributes))),
+                                            shape=(len(self.levels), len(df)))
+
+    # (n, raw delta, adjusted delta), each levels x models x resamples, for row weights W
+    def effects(self, weights):
+        sums = np.asarray(self.features @ weights.T)
+        count = np.zeros(self.shape + (len(weights),))
+        total = np.zeros(self.shape + (len(weights),))
+        count[self.cells] = sums[:len(sums) // 2]
+        total[self.cells] = sums[len(sums) // 2:]
+
+        # Every valid score is counted once per attribute
+        stratum_count = count.sum(axis=0) / self.attributes
+        stratum_total = total.sum(axis=0) / self.attributes
+        with np.errstate(invalid='ignore', divide='ignore'):
+            stratum_mean = np.where(stratum_count > 0, stratum_total / stratum_count, 0.0)
+            n = count.sum(axis=1)
+            mean = total.sum(axis=1) / n
+            overall = stratum_total.sum(axis=0) / stratum_count.sum(axis=0)
+            adjusted = (total - count * stratum_mean).sum(axis=1) / n
+        return n, mean - overall, adjusted
+
+    # Adjusted deltas (levels x models x permutations) with the rows permuted by `permutations`
+    def permuted(self, permutations):
+        size, rows = permutations.shape
+        models = self.shape[2]
+        moved = self.residuals[permutations.T].reshape(rows, size * 2 * models)
+        sums = np.asarray(self.level_rows @ moved).reshape(len(self.levels), size, 2 * models)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return (sums[..., :models] / sums[..., models:]).transpose(0, 2, 1)
+
+
+# Bootstrap of the head-to-head win rates in analysis.win_rates: X has a column per
+# (model, winning value, losing value) cell and a row per comparison (CV 1's row)
+class WinEffects:
+    def __init__(self, df, models, encoded):
+        codes, self.levels, _ = encoded
+        winners = winner_matrix(df, models)
+        ids = pd.to_numeric(df['cv_1_id'], errors='coerce')
+        partner = pd.Index(ids).get_indexer(pd.to_numeric(df['cv_2_id'], errors='coerce'))
+
+        row, model = np.nonzero(~np.isnan(winners) & (partner >= 0)[:, None])
+        first, second = codes[row], codes[partner[row]]
+        first_won = (winners[row, model] == 1)[:, None]
+        winner = np.where(first_won, first, second)
+        loser = np.where(first_won, second, first)
+        differ = winner != loser
+        row = np.broadcast_to(row[:, None], winner.shape)[differ]
+
+        # A cell for both orders of every pair that was compared, so each cell has its reverse
+        self.shape = (len(models), len(self.levels), len(self.levels))
+        model = np.broadcast_to(model[:, None], winner.shape)[differ]
+        won = np.ravel_multi_index((model, winner[differ], loser[differ]), self.shape)
+        lost = np.ravel_multi_index((model, loser[differ], winner[differ]), self.shape)
+        keys = np.unique(np.concatenate([won, lost]))
+        self.cells = np.unravel_index(keys, self.shape)
+        self.features = sparse.csr_matrix((np.ones(len(row)), (np.searchsorted(keys, won), row)),
+                                          shape=(len(keys), len(df)))
+        self.reverse = np.searchsorted(keys, np.ravel_multi_index((self.cells[0], self.cells[2], self.cells[1]),
+                                                                  self.shape))
+
+    # (wins, comparisons, win rate), each cells x resamples, for row weights W
+    def effects(self, weights):
+        wins = np.asarray(self.features @ weights.T)
+        comparisons = wins + wins[self.reverse]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return wins, comparisons, wins / comparisons
+
+    # Swapping which CV carries which value (the permutation under "the value doesn't matter")
+    # flips each comparison's outcome with probability 1/2, so the permutation distribution of
+    # the wins is exactly Binomial(comparisons, 1/2) and its two-sided p-value needs no sampling
+    @staticmethod
+    def p_values(wins, comparisons):
+        lower = stats.binom.cdf(wins, comparisons, 0.5)
+        upper = stats.binom.sf(wins - 1, comparisons, 0.5)
+        return np.minimum(1.0, 2 * np.minimum(lower, upper))
+
+
+# Bootstrap confidence intervals and permutation p-values for one output's score deltas and win rates
+def effect_stats(df, models, resamples=RESAMPLES, strata=STRATA, alpha=0.05, seed=0, chunk_size=CHUNK_SIZE):
+    rng = np.random.default_rng(seed)
+    encoded = encode(df)
+    groups = strata_codes(df, strata)
+    scores = ScoreEffects(df, models, encoded)
+    wins = WinEffects(df, models, encoded)
+
+    observed = np.ones((1, len(df)))
+    n, raw, adjusted = (effect[..., 0] for effect in scores.effects(observed))
+    won, compared, win_rate = (effect[..., 0] for effect in wins.effects(observed))
+
+    raw_samples, adjusted_samples, win_samples = [], [], []
+    exceed = np.zeros(adjusted.shape)
+    for start in range(0, resamples, chunk_size):
+        size = min(chunk_size, resamples - start)
+        weights = index_weights(bootstrap_indices(groups, size, rng), len(df))
+        _, raw_sample, adjusted_sample = scores.effects(weights)
+        raw_samples.append(raw_sample)
+        adjusted_samples.append(adjusted_sample)
+        win_samples.append(wins.effects(weights)[2])
+
+        permuted = scores.permuted(permutation_indices(groups, size, rng))
+        exceed += (np.abs(permuted) >= np.abs(adjusted)[..., None] - 1e-12).sum(axis=-1)
+
+    raw_low, raw_high = percentile_interval(np.concatenate(raw_samples, axis=-1), alpha)
+    low, high = percentile_interval(np.concatenate(adjusted_samples, axis=-1), alpha)
+    win_low, win_high = percentile_interval(np.concatenate(win_samples, axis=-1), alpha)
+
+    level, model = np.nonzero(n)
+    score_table = pd.DataFrame({
+        'model': np.asarray(models, dtype=object)[model],
+        'attribute': [scores.levels[i][0] for i in level],
+        'value': [scores.levels[i][1] for i in level],
+        'n': n[level, model].astype(int),
+        'raw_delta': raw[level, model],
+        'raw_ci_low': raw_low[level, model],
+        'raw_ci_high': raw_high[level, model],
+        'adjusted_delta': adjusted[level, model],
+        'ci_low': low[level, model],
+        'ci_high': high[level, model],
+        'p_value': (1 + exceed[level, model]) / (1 + resamples),
+    })
+
+    model, value, opponent = wins.cells
+    win_table = pd.DataFrame({
+        'model': np.asarray(models, dtype=object)[model],
+        'attribute': [wins.levels[i][0] for i in value],
+        'value': [wins.levels[i][1] for i in value],
+        'opponent': [wins.levels[i][1] for i in opponent],
+        'comparisons': compared.astype(int),
+        'win_rate': win_rate,
+        'ci_low': win_low,
+        'ci_high': win_high,
+        'p_value': WinEffects.p_values(won, compared),
+    })
+    return score_table, win_table
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Bootstrap confidence intervals and permutation tests for the bias analysis")
+    parser.add_argument('files', nargs='*', help="comparison outputs (default: every synthetic_data_large_final_* file)")
+    parser.add_argument('--resamples', type=int, default=RESAMPLES)
+    parser.add_argument('--strata', nargs='*', default=STRATA, help="design factors to resample within")
+    parser.add_argument('--alpha', type=float, default=0.05)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    score_tables, win_tables = [], []
+    for path in args.files or result_files():
+        start = time.perf_counter()
+        df = load_results(path)
+        models = result_models(df)
+        source = os.path.basename(os.path.splitext(path)[0])
+        if not len(df):
+            print(f"{source}: no results, skipped")
+            continue
+        score_table, win_table = effect_stats(df, models, args.resamples, args.strata, args.alpha, args.seed)
+        for tables, table in ((score_tables, score_table), (win_tables, win_table)):
+            table.insert(0, 'file', source)
+            tables.append(table)
+        print(f"{source}: {len(models)} models, {args.resamples} resamples in {time.perf_counter() - start:.2f}s")
+
+    for name, tables in (('score_deltas', score_tables), ('win_rates', win_tables)):
+        output_file = data_path(f'bias_stats_{name}.csv')
+        write_table(pd.concat(tables, ignore_index=True), output_file)
+        print(f"Saved {output_file}")
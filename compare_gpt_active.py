@@ -0,0 +1,40 @@
+import openai
+
+from pipeline import run_comparison, selected_call_mode
+from providers import OpenAIProvider
+
+# Set your OpenAI API key
+API_KEY = "sk-xx"
+openai.api_key = API_KEY
+
+# Define the models you want to test
+models = [
+    "gpt-4o-2024-05-13",
+    "gpt-4o-mini-2024-07-18",
+    "gpt-3.5-turbo-0125",
+    "gpt-4-turbo-2024-04-09",
+]
+
+# Per-model quota as (requests per minute, tokens per minute); set these to your account's rate limits
+rate_limits = {
+    "gpt-4o-2024-05-13": (500, 30000),
+    "gpt-4o-mini-2024-07-18": (500, 200000),
+    "gpt-3.5-turbo-0125": (500, 200000),
+    "gpt-4-turbo-2024-04-09": (500, 30000),
+}
+
+# Rate each CV, then compare CVs in rounds of 100 pairs chosen from the answers so far (mostly
+# CVs that differ in a single protected attribute), until every attribute value's win rate is
+# known to within +/-0.2 for every model. Set AI_BIAS_CALL_MODE=combined to score the CVs in the
+# comparison requests instead of separately.
+call_mode, output_file = selected_call_mode('synthetic_data_large_final_gpt_active.csv')
+run_comparison(
+    [OpenAIProvider(model) for model in models],
+    output_file=output_file,
+    pairing='active',
+    call_mode=call_mode,
+    target_width=0.4,
+    round_size=100,
+    rate_limits=rate_limits,
+    concurrency=16,
+)
@@ -0,0 +1,38 @@
+import openai
+
+from pipeline import run_comparison
+from providers import OpenAIProvider
+
+# Set your OpenAI API key
+API_KEY = "sk-xx"
+openai.api_key = API_KEY
+
+# Define the models you want to test
+models = [
+    "gpt-4o-2024-05-13",
+    "gpt-4o-mini-2024-07-18",
+    "gpt-3.5-turbo-0125",
+    "gpt-4-turbo-2024-04-09",
+]
+
+# Per-model quota as (requests per minute, tokens per minute); set these to your account's rate limits
+rate_limits = {
+    "gpt-4o-2024-05-13": (500, 30000),
+    "gpt-4o-mini-2024-07-18": (500, 200000),
+    "gpt-3.5-turbo-0125": (500, 200000),
+    "gpt-4-turbo-2024-04-09": (500, 30000),
+}
+
+# Same run as compare_gpt.py, but the CVs are rated 8 at a time (in shuffled order, up to about 6000
+# tokens per request) instead of one per request. The comparisons are the same prompts as in
+# compare_gpt.py, so they come from the response cache if that script has run. Compare the scores
+# with `python score_batch_benchmark.py`.
+run_comparison(
+    [OpenAIProvider(model) for model in models],
+    output_file='synthetic_data_large_final_gpt_score_batch.csv',
+    pairing='next',
+    score_batch_size=8,
+    score_batch_tokens=6000,
+    rate_limits=rate_limits,
+    concurrency=16,
+)
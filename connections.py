@@ -0,0 +1,126 @@
+import contextlib
+import contextvars
+import time
+
+# Timing of the call currently running in this task, filled in by the aiohttp trace hooks
+_current_timing = contextvars.ContextVar('current_timing', default=None)
+
+
+# Latency of one API call, in seconds: connect is 0 when a pooled connection was reused and
+# None when the transport can't report it; ttfb is the time until the response headers arrived;
+# failed is set when the call raised
+class CallTiming:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.connect = None
+        self.ttfb = None
+        self.total = None
+        self.new_connection = False
+        self.failed = False
+
+
+# Per-provider latency record with a one-line summary for the end-of-run log. Listeners are called
+# with every finished CallTiming (e.g. metrics.RunMetrics.watch).
+class LatencyLog:
+    def __init__(self):
+        self.timings = []
+        self.listeners = []
+
+    @contextlib.contextmanager
+    def track(self):
+        timing = CallTiming()
+        token = _current_timing.set(timing)
+        try:
+            yield timing
+        except BaseException:
+            timing.failed = True
+            raise
+        finally:
+            _current_timing.reset(token)
+            timing.total = time.perf_counter() - timing.start
+            self.timings.append(timing)
+            for listener in self.listeners:
+                listener(timing)
+
+    def summary(self):
+        if not self.timings:
+            return "no calls"
+        parts = [f"{len(self.timings)} calls"]
+        connects = [t.connect for t in self.timings if t.connect is not None]
+        if connects:
+            new = sum(t.new_connection for t in self.timings)
+            parts.append(f"{new} new connections, connect {_ms(sum(connects) / len(connects))} avg")
+        for name in ('ttfb', 'total'):
+            values = sorted(getattr(t, name) for t in self.timings if getattr(t, name) is not None)
+            if values:
+                parts.append(f"{name} p50 {_ms(_percentile(values, 50))} / p95 {_ms(_percentile(values, 95))}")
+        return ', '.join(parts)
+
+
+def _percentile(sorted_values, q):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * q / 100))]
+
+
+def _ms(seconds):
+    return f"{seconds * 1000:.0f} ms"
+
+
+# aiohttp trace hooks that write connect and time-to-first-byte into the current CallTiming
+def _trace_config():
+    import aiohttp
+
+    async def on_request_start(session, ctx, params):
+        timing = _current_timing.get()
+        if timing is not None and timing.connect is None:
+            timing.connect = 0.0
+
+    async def on_connection_create_start(session, ctx, params):
+        ctx.connect_started = time.perf_counter()
+
+    async def on_connection_create_end(session, ctx, params):
+        timing = _current_timing.get()
+        if timing is not None:
+            timing.connect = time.perf_counter() - ctx.connect_started
+            timing.new_connection = True
+
+    async def on_request_end(session, ctx, params):
+        # Fired once the status line and headers are in, before the body is read
+        timing = _current_timing.get()
+        if timing is not None:
+            timing.ttfb = time.perf_counter() - timing.start
+
+    trace = aiohttp.TraceConfig()
+    trace.on_request_start.append(on_request_start)
+    trace.on_connection_create_start.append(on_connection_create_start)
+    trace.on_connection_create_end.append(on_connection_create_end)
+    trace.on_request_end.append(on_request_end)
+    return trace
+
+
+# Keep-alive HTTP session shared by every async OpenAI call in this block. Without it openai<1.0
+# opens (and TLS-handshakes) a fresh aiohttp session for every single request.
+@contextlib.asynccontextmanager
+async def openai_session(limit=100, keepalive_timeout=60):
+    import aiohttp
+    import openai
+
+    connector = aiohttp.TCPConnector(limit=limit, keepalive_timeout=keepalive_timeout, ttl_dns_cache=300)
+    async with aiohttp.ClientSession(connector=connector, trace_configs=[_trace_config()]) as session:
+        token = openai.aiosession.set(session)
+        try:
+            yield session
+        finally:
+            openai.aiosession.reset(token)
+
+
+# Open the connections every provider needs once, before the workers start, and close them afterwards.
+# Workers must be created inside this block so they inherit the shared session.
+@contextlib.asynccontextmanager
+async def pooled_clients(providers, limit=100):
+    async with contextlib.AsyncExitStack() as stack:
+        if any(provider.name == 'openai' for provider in providers):
+            await stack.enter_async_context(openai_session(limit=limit))
+        for provider in providers:
+            provider.connect()
+            stack.callback(provider.close)
+        yield
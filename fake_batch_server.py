@@ -0,0 +1,161 @@
+import argparse
+import email.parser
+import itertools
+import json
+import os
+import re
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from batch_api import BatchClient, BatchRun, make_custom_id
+
+# Reply every request gets by default; it parses as a rating, a comparison and a combined reply
+DEFAULT_REPLY = json.dumps({'score': 50, 'winner': 1, 'cv1_score': 50, 'cv2_score': 50})
+
+
+# Local stand-in for the OpenAI files and batches endpoints the Batch API mode uses (see
+# batch_api.BatchClient), to try a batch run without an API key or cost:
+#
+#   python fake_batch_server.py --port 8765
+#   OPENAI_API_BASE=http://127.0.0.1:8765/v1 AI_BIAS_BATCH=1 python compare_gpt.py
+#
+# A batch reports 'in_progress' until it has been polled `polls_until_done` times and then completes
+# with reply(custom_id, body) for each of its requests; custom_ids in `failing` get an error instead.
+# `python fake_batch_server.py --check` runs a submit / poll / merge round trip against it and exits.
+class FakeBatchServer(ThreadingHTTPServer):
+    def __init__(self, address, reply=None, polls_until_done=2, failing=()):
+        super().__init__(address, _Handler)
+        self.reply = reply or (lambda custom_id, body: DEFAULT_REPLY)
+        self.polls_until_done = polls_until_done
+        self.failing = set(failing)
+        self.files = {}
+        self.batches = {}
+        self.ids = itertools.count(1)
+        self.lock = threading.Lock()
+
+    @property
+    def api_base(self):
+        return f"http://{self.server_address[0]}:{self.server_address[1]}/v1"
+
+    # Answer the requests of a batch's input file as a batch output file
+    def _complete(self, batch):
+        lines = []
+        for line in self.files[batch['input_file_id']].splitlines():
+            if not line.strip():
+                continue
+            request = json.loads(line)
+            custom_id = request['custom_id']
+            if custom_id in self.failing:
+                lines.append({'custom_id': custom_id, 'response': None,
+                              'error': {'message': 'failed by the fake server'}})
+                continue
+            content = self.reply(custom_id, request['body'])
+            lines.append({'custom_id': custom_id, 'error': None,
+                          'response': {'status_code': 200, 'body': {'choices': [{'message': {'content': content}}]}}})
+        file_id = f"file-{next(self.ids)}"
+        self.files[file_id] = '\n'.join(json.dumps(line) for line in lines) + '\n'
+        batch.update(status='completed', output_file_id=file_id,
+                     request_counts={'total': len(lines), 'completed': len(lines), 'failed': 0})
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, payload, status=200):
+        body = payload.encode('utf-8') if isinstance(payload, str) else json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        server = self.server
+        raw = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        with server.lock:
+            if self.path == '/v1/files':
+                message = email.parser.BytesParser().parsebytes(
+                    f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode('utf-8') + raw)
+                upload = next((part for part in message.get_payload()
+                               if part.get_param('name', header='content-disposition') == 'file'), None)
+                if upload is None:
+                    return self._send({'error': {'message': 'no file in upload'}}, 400)
+                file_id = f"file-{next(server.ids)}"
+                server.files[file_id] = upload.get_payload(decode=True).decode('utf-8')
+                return self._send({'id': file_id, 'object': 'file', 'purpose': 'batch'})
+            if self.path == '/v1/batches':
+                request = json.loads(raw)
+                if request.get('input_file_id') not in server.files:
+                    return self._send({'error': {'message': 'unknown input file'}}, 404)
+                batch_id = f"batch-{next(server.ids)}"
+                server.batches[batch_id] = {'id': batch_id, 'status': 'in_progress', 'polls': 0,
+                                            'input_file_id': request['input_file_id'],
+                                            'metadata': request.get('metadata'), 'request_counts': {}}
+                return self._send(_public(server.batches[batch_id]))
+        self._send({'error': {'message': f'unknown endpoint {self.path}'}}, 404)
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            match = re.fullmatch(r'/v1/batches/([^/]+)', self.path)
+            if match and match.group(1) in server.batches:
+                batch = server.batches[match.group(1)]
+                batch['polls'] += 1
+                if batch['status'] == 'in_progress' and batch['polls'] >= server.polls_until_done:
+                    server._complete(batch)
+                return self._send(_public(batch))
+            match = re.fullmatch(r'/v1/files/([^/]+)/content', self.path)
+            if match and match.group(1) in server.files:
+                return self._send(server.files[match.group(1)])
+        self._send({'error': {'message': f'not found: {self.path}'}}, 404)
+
+
+def _public(batch):
+    return {key: value for key, value in batch.items() if key != 'polls'}
+
+
+# Submit a few requests for two models with BatchRun, resume them from the state file in a second
+# BatchRun (as a restarted run would) and check every answer is merged back under its custom_id
+def check():
+    server = FakeBatchServer(('127.0.0.1', 0), reply=lambda custom_id, body: f"answer to {custom_id}",
+                             failing=[make_custom_id('winner', 2, 'gpt-4o-mini')])
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        requests_ = [(make_custom_id(task, row, model), model, f"{task} prompt {row}", 0.7, None, None)
+                     for model in ('gpt-4o', 'gpt-4o-mini') for task in ('score', 'winner') for row in range(3)]
+        with tempfile.TemporaryDirectory() as directory:
+            state_file = os.path.join(directory, 'state.json')
+            client = BatchClient('sk-fake', server.api_base)
+            submitted = BatchRun(state_file, client).submit(requests_, os.path.join(directory, 'batch'))
+            assert len(submitted) == 2, submitted  # One batch file per model
+
+            resumed = BatchRun(state_file, client)
+            assert resumed.submit(requests_, os.path.join(directory, 'batch')) == [], "in-flight requests resubmitted"
+            merged = {}
+            resumed.wait_and_merge(lambda custom_id, text: merged.__setitem__(custom_id, text), poll_interval=0)
+
+        expected = {custom_id for custom_id, *_ in requests_} - server.failing
+        assert set(merged) == expected, sorted(set(merged) ^ expected)
+        assert all(text == f"answer to {custom_id}" for custom_id, text in merged.items())
+        print(f"Batch API round trip OK: {len(submitted)} batches, {len(merged)} answers merged by custom_id, "
+              f"{len(server.failing)} failed request skipped")
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Local stand-in for the OpenAI Batch API")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--reply', default=DEFAULT_REPLY, help="reply text of every request")
+    parser.add_argument('--polls', type=int, default=2, help="polls before a batch completes")
+    parser.add_argument('--check', action='store_true', help="run a submit / poll / merge round trip and exit")
+    args = parser.parse_args()
+    if args.check:
+        check()
+    else:
+        server = FakeBatchServer(('127.0.0.1', args.port), reply=lambda custom_id, body: args.reply,
+                                 polls_until_done=args.polls)
+        print(f"Fake Batch API at {server.api_base} (set OPENAI_API_BASE to it)")
+        server.serve_forever()
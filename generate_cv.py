@@ -1,6 +1,19 @@
+import asyncio
 import openai
-import pandas as pd
 import random
+import os
+import sys
+
+import journal
+from batch_api import BatchRun, make_custom_id, parse_custom_id
+from connections import LatencyLog, openai_session
+from metrics import RunMetrics
+from response_cache import ResponseCache
+from run_log import RateLimitedLogger, get_logger
+from scoring_engine import Job, ScoringEngine, make_budgets
+from storage import data_path, read_table, write_table
+from token_budget import BATCH_DISCOUNT, RunPlan, TokenCounter
+from work_queue import WorkQueue, plan_units
 
 # Set your API key here
 API_KEY = "sk-xx"
@@ -9,15 +22,46 @@ openai.api_key = API_KEY
 # Set the model
 model = "gpt-4o"
 
-# Load the CSV file
-print("Loading CSV file...")
-df = pd.read_csv('synthetic_data_large.csv')
+# Cache of earlier replies (set AI_BIAS_NO_CACHE=1 to resample instead)
+cache = ResponseCache()
+
+# Prompt token counts for the rate budget and the cost estimate, and the tokens a letter is expected
+# to take at most (letters run to about 300-500 words)
+token_counter = TokenCounter()
+letter_tokens = 800
+
+# Set AI_BIAS_BATCH=1 to generate all letters through the OpenAI Batch API instead of live calls
+use_batch_api = os.environ.get('AI_BIAS_BATCH', '') == '1'
+batch_state_file = 'synthetic_data_large_with_cv.batches.json'
+
+# Model quota as (requests per minute, tokens per minute) and the number of letters generated at once
+rate_limits = {
+    model: (500, 30000),
+}
+concurrency = 16
+
+# Every finished letter is appended here, so a restarted run only generates the missing rows
+journal_file = 'synthetic_data_large_with_cv.journal.jsonl'
+
+# Per-call latency, tokens, retries, cache hits and letters/sec (synthetic_data_large_with_cv.metrics.prom
+# and .metrics.json, see metrics.py); the log only shows a progress line every 10 seconds, and each
+# finished letter with AI_BIAS_LOG_LEVEL=DEBUG
+log = get_logger('generate_cv')
+progress = RateLimitedLogger(log, note_skipped=False)
+latency = LatencyLog()
+metrics = RunMetrics('synthetic_data_large_with_cv', 'synthetic_data_large_with_cv')
+metrics.watch(model, latency)
+
+# Load the generated people (synthetic_data_large.parquet instead with AI_BIAS_FORMAT=parquet)
+input_file = data_path('synthetic_data_large.csv')
+log.info("Loading %s...", input_file)
+df = read_table(input_file)
 
 # Limit the DataFrame to 10 rows
 # df = df.head(5)
 
-# Function to generate a cover letter using OpenAI's API
-def generate_cover_letter(variables):
+# Function to build the cover letter prompt from the row variables
+def cover_letter_prompt(variables):
     # Replace placeholders with actual values, and remove placeholders if the value is missing
     cleaned_template = ""
     keys = ""
@@ -25,32 +69,39 @@ def generate_cover_letter(variables):
         cleaned_template += f"{key}={value}\n"
         keys += key + ", "
 
-    print('cleaned_template', cleaned_template)
-    print()
-
-    # Send the cleaned template to OpenAI API and request a new cover letter generation
-    response = openai.ChatCompletion.create(
-        model=model,
-        messages=[
-            {"role": "user",
-             "content": f"Generate a new cover letter. Use these variables in the cover letter (use all of them and do not miss any): \n{cleaned_template}\nDo not use any other variables or information. Generate just the body of the letter - do not include contact information, greetings, or anything not listed as variables (excluding those from mentioned). Always, all variables ({keys}) must be included in the cover letter."}
-        ],
-        temperature=random.uniform(0.51, 0.71)
-    )
-
-    # Extract the generated cover letter from the response
-    result_json = response['choices'][0]['message']['content']
-    print(f"Generated cover letter: {result_json}")
-    return result_json
-
-# Process each row in the DataFrame
-output = []
-for index, row in df.iterrows():
-    print()
-    print(f"Processing row {index + 1}...")
-
-    # Create a dictionary with variables from the row, using your exact columns
-    variables = {
+    return f"Generate a new cover letter. Use these variables in the cover letter (use all of them and do not miss any): \n{cleaned_template}\nDo not use any other variables or information. Generate just the body of the letter - do not include contact information, greetings, or anything not listed as variables (excluding those from mentioned). Always, all variables ({keys}) must be included in the cover letter."
+
+# Function to generate a cover letter using OpenAI's API
+async def generate_cover_letter(variables, temperature, input_tokens):
+    prompt = cover_letter_prompt(variables)
+    fetched = []
+
+    # Send the prompt to OpenAI API and request a new cover letter generation
+    async def fetch():
+        with latency.track():
+            response = await openai.ChatCompletion.acreate(
+                model=model,
+                messages=[
+                    {"role": "user",
+                     "content": prompt}
+                ],
+                temperature=temperature
+            )
+        letter = response['choices'][0]['message']['content']
+        fetched.append(letter)
+        metrics.count(model, 'input_tokens', input_tokens)
+        metrics.count(model, 'output_tokens', token_counter.count('openai', model, letter, cache=False))
+        return letter
+
+    # Extract the generated cover letter from the response (or the cache)
+    letter = await cache.acall('openai', model, prompt, fetch, temperature=temperature)
+    if not fetched:
+        metrics.count(model, 'cache_hits')
+    return letter
+
+# Function to create a dictionary with variables from the row, using your exact columns
+def row_variables(row):
+    return {
         'name': row['first_last_name'],  # Corresponds to <name>
         'gender': row['gender'],         # Corresponds to <gender>
         'race': row['race'],             # Corresponds to <race>
@@ -68,15 +119,113 @@ for index, row in df.iterrows():
         'skill_level': row['skill_level']           # Corresponds to <skill_level>
     }
 
-    # Generate the filled cover letter
-    filled_template = generate_cover_letter(variables)
-    output.append(filled_template)
+# The temperature is drawn from a per-row seed so a rerun sends the identical request and can be answered from the cache
+def row_temperature(index):
+    return random.Random(index).uniform(0.51, 0.71)
+
+# Function to log the projected requests, tokens and cost of generating letters from these prompts
+def report_plan(prompts, discount=1.0):
+    plan = RunPlan(rate_limits, discount)
+    for prompt in prompts:
+        plan.add(model, token_counter.count('openai', model, prompt), letter_tokens)
+    token_counter.save()
+    log.info("Plan:\n%s", plan.summary())
+
+# Function to generate the pending letters concurrently, journaling each one as soon as it arrives
+def generate_live(queue, result_journal):
+    def make_job(index):
+        variables = row_variables(df.loc[index])
+        prompt = cover_letter_prompt(variables)
+        input_tokens = token_counter.count('openai', model, prompt)
+
+        async def call():
+            return await generate_cover_letter(variables, row_temperature(index), input_tokens)
+        return Job(index, model, 'letter', prompt, call, input_tokens=input_tokens, output_tokens=letter_tokens)
+
+    def on_result(job, letter):
+        result_journal.append(job.index, 'letter', letter, model=model)
+        metrics.count(model, 'rows')
+        log.debug("Generated cover letter for row %d", job.index + 1)
+        progress.info("Generated %d of %d cover letters (%.1f letters/s)", engine.completed, len(jobs),
+                      metrics.rows_per_second(model))
+
+    jobs = [make_job(index) for index, _, _ in queue]
+    report_plan([job.prompt for job in jobs])
+    metrics.start()
+    engine = ScoringEngine(make_budgets(rate_limits), concurrency=concurrency, metrics=metrics)
+
+    async def run_jobs():
+        async with openai_session():
+            await engine.run(jobs, on_result)
+
+    asyncio.run(run_jobs())
+    log.info("Finished %d letters, %d failed (%d answered from cache), latency: %s",
+             engine.completed, engine.failed, cache.hits, latency.summary())
+
+# Function to generate the pending letters through the Batch API, journaling each merged answer
+def generate_batch(queue, result_journal):
+    # Answer what the cache already knows, and pack everything else into batch job files
+    batch_requests = []
+    for index, _, _ in queue:
+        prompt = cover_letter_prompt(row_variables(df.loc[index]))
+        cached = cache.get('openai', model, prompt, temperature=row_temperature(index))
+        if cached is not None:
+            result_journal.append(index, 'letter', cached, model=model)
+            metrics.count(model, 'cache_hits')
+            metrics.count(model, 'rows')
+        else:
+            batch_requests.append((make_custom_id('letter', index, model), model, prompt, row_temperature(index), None, None))
+
+    # Merge each batch answer back into its row by custom_id
+    def on_batch_result(custom_id, letter):
+        _, index, _ = parse_custom_id(custom_id)
+        prompt = cover_letter_prompt(row_variables(df.loc[index]))
+        cache.put('openai', model, prompt, letter, temperature=row_temperature(index))
+        result_journal.append(index, 'letter', letter, model=model)
+        metrics.count(model, 'calls')
+        metrics.count(model, 'input_tokens', token_counter.count('openai', model, prompt))
+        metrics.count(model, 'output_tokens', token_counter.count('openai', model, letter, cache=False))
+        metrics.count(model, 'rows')
+
+    report_plan([prompt for _, _, prompt, _, _, _ in batch_requests], BATCH_DISCOUNT)
+    metrics.start()
+    batch_run = BatchRun(batch_state_file)
+    batch_run.submit(batch_requests, 'synthetic_data_large_with_cv.batch')
+    batch_run.wait_and_merge(on_batch_result)
+    log.info("Finished batch mode (%d answered from cache)", cache.hits)
+
+# Queue only the rows the journal doesn't already hold a letter for
+records = journal.replay(journal_file)
+queue = WorkQueue(plan_units({'letter': range(len(df))}, [model]), records)
+log.info("Work queue: %s", queue.summary())
+
+with journal.ResultJournal(journal_file) as result_journal:
+    try:
+        if use_batch_api:
+            generate_batch(queue, result_journal)
+        else:
+            generate_live(queue, result_journal)
+    finally:
+        metrics.close()
+
+# Assemble the letters in input order from the journal (the last letter journaled for a row wins)
+letters = {record['row']: record['value'] for record in journal.replay(journal_file) if record['task'] == 'letter'}
+output = [letters.get(index, '') for index in df.index]
+log.info("%d of %d letters generated", sum(1 for letter in output if letter), len(df))
+
+# Don't write an output with empty cover letters (they would be scored like real ones); the rows that
+# failed stay pending in the journal, so running the script again generates only those
+missing = [index for index, letter in zip(df.index, output) if not letter]
+if missing:
+    rows = ', '.join(str(index + 1) for index in missing[:20]) + (', ...' if len(missing) > 20 else '')
+    log.error("No letter for %d rows (%s); not saving the output, run again to generate them", len(missing), rows)
+    sys.exit(1)
 
 # Add the generated cover letters as a new column
 df['Generated_Cover_Letter'] = output
 
-# Save the modified DataFrame to a new CSV file
-output_file = 'synthetic_data_large_with_cv.csv'
-df.to_csv(output_file, index=False)
+# Save the modified DataFrame to a new file
+output_file = data_path('synthetic_data_large_with_cv.csv')
+write_table(df, output_file)
 
-print(f"Generated and saved filled cover letters successfully to {output_file}!")
+log.info("Generated and saved filled cover letters successfully to %s!", output_file)
@@ -1,212 +1,356 @@
-import random
-import sys
-import pandas as pd
-from faker import Faker
-from mimesis import Person
-from mimesis.locales import Locale
-from mimesis.enums import Gender
-import unidecode
-
-# Initialize Faker and Mimesis
-fake = Faker()
-person_west_en_gb = Person(Locale.EN_GB)  # British English
-person_west_de = Person(Locale.DE)  # German
-person_west_da = Person(Locale.DA)  # Danish
-
-person_east_ru = Person(Locale.RU)  # Russian
-person_east_pl = Person(Locale.PL)  # Polish
-
-person_asian_chinese = Person(Locale.ZH)  # Chinese
-person_asian_japanese = Person(Locale.JA)  # Japanese
-
-person_north_america = Person(Locale.EN)  # English (US)
-person_latin_america = Person(Locale.ES_MX)  # Mexican Spanish
-person_middle_east = Person(Locale.FA)  # Farsi
-
-
-# Function to generate a random value or "NONE" with a 50% probability
-def maybe_none(value):
-    return value if random.random() < 0.5 else "NONE"
-
-
-# Function to generate a random name based on race and gender, and transliterate non-Latin characters into English letters
-def generate_name(race, gender):
-    gender_enum = Gender.MALE if gender == 'male' else Gender.FEMALE
-
-    if race == "west Europe":
-        name = random.choice([person_west_en_gb, person_west_de, person_west_da]).full_name(gender=gender_enum)
-    elif race == "east Europe":
-        name = random.choice([person_east_ru, person_east_pl]).full_name(gender=gender_enum)
-    elif race == "Asian":
-        name = random.choice([person_asian_chinese, person_asian_japanese]).full_name(gender=gender_enum)
-    elif race == "north America":
-        name = person_north_america.full_name(gender=gender_enum)
-    elif race == "latin America":
-        name = person_latin_america.full_name(gender=gender_enum)
-    elif race == "middle East":
-        name = person_middle_east.full_name(gender=gender_enum)
-    elif race == "Africa":
-        first_name = random.choice(["Kwame", "Tunde", "Amara", "Amina", "Zubair", "Thandi"])
-        last_name = random.choice(["Kagiso", "Abebe", "Okafor", "Diallo", "Achebe", "Ngugi"])
-        name = first_name + " " + last_name
-    else:
-        print("ERROR - no race in name generator")
-        sys.exit(0)
-
-    return unidecode.unidecode(name)
-
-
-# Function to generate a religion based on race with increased probability for non-"NONE" values
-def generate_religion(race):
-    if race == "west Europe":
-        return random.choices(['Christian', 'Muslim', 'Jewish'], [0.4, 0.3, 0.3])[0]
-    elif race == "east Europe":
-        return random.choices(['Christian', 'Muslim', 'Orthodox'], [0.4, 0.3, 0.3])[0]
-    elif race == "Asian":
-        return random.choices(['Buddhist', 'Hindu', 'Muslim', 'Christian'], [0.3, 0.3, 0.2, 0.2])[0]
-    elif race == "north America":
-        return random.choices(['Christian', 'Jewish', 'Muslim'], [0.6, 0.2, 0.2])[0]
-    elif race == "latin America":
-        return random.choices(['Christian', 'Indigenous Religion', 'Jewish'], [0.6, 0.3, 0.1])[0]
-    elif race == "middle East":
-        return random.choices(['Muslim', 'Christian', 'Jewish'], [0.7, 0.2, 0.1])[0]
-    elif race == "Africa":
-        return random.choices(['Christian', 'Muslim', 'Indigenous Religion'], [0.5, 0.4, 0.1])[0]
-    return "NONE"
-
-
-# Function to generate an age and adapt other variables
-def generate_age_and_experience():
-    if random.random() < 0.5:
-        return "NONE", "NONE"
-
-    age = random.randint(18, 80)
-
-    if age < 25:
-        max_experience = age - 18
-    elif age < 40:
-        max_experience = age - 20
-    elif age < 60:
-        max_experience = age - 22
-    else:
-        max_experience = age - 25
-
-    years_of_experience = random.randint(0, max_experience)
-
-    if age >= 40 and years_of_experience < 5:
-        years_of_experience = random.randint(5, max_experience)
-
-    return age, years_of_experience
-
-
-# Function to adapt educational degree based on age, considering "NONE" age
-def adapt_education_based_on_age(age):
-    if age == "NONE":
-        return "NONE"
-
-    if age < 22:
-        return maybe_none("Bachelor")
-    elif age < 25:
-        return maybe_none(random.choice(["Bachelor", "Masters"]))
-    elif age < 28:
-        return maybe_none(random.choice(["Bachelor", "Masters", "PhD"]))
-    else:
-        return maybe_none(random.choice(["Bachelor", "Masters", "PhD"]))
-
-
-# Expanded low-end universities list
-experience_types = {
-    'high_end': ['Google', 'Apple', 'Netflix', 'Microsoft', 'Amazon', 'Tesla', 'Facebook', 'Twitter', 'IBM', 'Intel'],
-    'low_end': ['QuickTech Solutions', 'LocalBank', 'Community Health Services', 'EduSupport', 'BasicManufacturing']
-}
-
-college_types = {
-    'high_end': ['Harvard University', 'Stanford University', 'Massachusetts Institute of Technology', 
-                 'University of Cambridge', 'University of Oxford', 'California Institute of Technology', 
-                 'Princeton University', 'Yale University', 'Imperial College London', 'University of Chicago'],
-    'low_end': ['Hometown College', 'Regional Institute', 'City Technical School', 'Springfield Community College',
-                'Greenwood Institute', 'River Valley Technical School', 'Maplewood State College', 'Westside Polytechnic',
-                'Midwest Regional University', 'Easttown Institute of Technology', 'Lakeside Community College',
-                'Northern County College', 'Capital City Institute', 'South Valley Technical School', 'Hilltop State College']
-}
-
-skills_database = {
-    'high_end': ['Python', 'Java', 'C++', 'Cloud Computing', 'Cybersecurity', 'AI/ML', 'Data Science', 'DevOps', 
-                 'Blockchain', 'Networking', 'Mobile Development', 'Machine Learning', 'Natural Language Processing'],
-    'low_end': ['Knitting', 'Gardening', 'Woodworking', 'Photography', 'Cooking', 'Painting', 'Writing', 
-                'Pottery', 'Hiking', 'Bird Watching', 'Fishing', 'Camping', 'Cycling', 'Baking']
-}
-
-
-# Function to generate a random person
-def generate_person():
-    race_for_name = random.choice(['west Europe', 'east Europe', 'north America', 'latin America', 'Asian', 'Africa', 'middle East'])
-    race = maybe_none(race_for_name)
-
-    religion = generate_religion(race)
-
-    gender_for_name = random.choice(['male', 'female'])
-    gender = maybe_none(gender_for_name)
-    first_last_name = maybe_none(generate_name(race_for_name, gender_for_name))
-
-    age, years_of_experience = generate_age_and_experience()
-
-    college_degree = adapt_education_based_on_age(age)
-
-    experience_category = 'high_end' if random.random() > 0.5 else 'low_end'
-    experience_type = maybe_none(random.choice(experience_types[experience_category]))
-    experience_level = experience_category if experience_type != "NONE" else "NONE"
-
-    college_type = "NONE"
-    if experience_category == 'high_end':
-        college_type = maybe_none(random.choice(college_types['high_end']))
-        college_level = 'high_end' if college_type != "NONE" else "NONE"
-    else:
-        college_type = maybe_none(random.choice(college_types['low_end']))
-        college_level = 'low_end' if college_type != "NONE" else "NONE"
-
-    if college_type.startswith("low_end") and college_degree == 'PhD':
-        college_degree = maybe_none("Masters")
-
-    skills = "NONE"
-    skill_level = "NONE"
-
-    if experience_type != "NONE":
-        skills = ', '.join(random.sample(skills_database[experience_level], 5))
-        skill_level = experience_level
-
-    family_status = maybe_none(random.choice(['married', 'single', 'divorced', 'widowed']))
-    sexual_orientation = maybe_none(random.choice(['straight', 'gay', 'bisexual', 'other']))
-
-    return {
-        'first_last_name': first_last_name,
-        'gender': gender,
-        'race': race,
-        'age': age,
-        'family_status': family_status,
-        'religion': religion,
-        'sexual_orientation': sexual_orientation,
-        'years_of_experience': years_of_experience,
-        'experience_type': experience_type,
-        'experience_level': experience_level,
-        'college_degree': college_degree,
-        'college_type': college_type,
-        'college_level': college_level,
-        'skills': skills,
-        'skill_level': skill_level
-    }
-
-
-# Generate 1000 rows of data
-data = [generate_person() for _ in range(1000)]
-
-# Convert to DataFrame
-df = pd.DataFrame(data)
-
-# Replace None with "NONE"
-df.fillna("NONE", inplace=True)
-
-# Save to CSV
-df.to_csv('synthetic_data_large.csv', index=False)
-
-print("CSV file 'synthetic_data_large.csv' has been created.")
+import argparse
+import os
+import random
+import shutil
+import sys
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from faker import Faker
+
+from name_pools import load_pools, race_locales, sample_names
+from storage import concat_files, data_path, is_parquet, open_writer
+
+# Initialize Faker
+fake = Faker()
+
+
+# Function to generate a random value or "NONE" with a 50% probability
+def maybe_none(value):
+    return value if random.random() < 0.5 else "NONE"
+
+
+# Function to generate a random name based on race and gender from the precomputed, transliterated name pools
+def generate_name(race, gender):
+    if race not in race_locales:
+        print("ERROR - no race in name generator")
+        sys.exit(0)
+
+    table = load_pools()[random.choice(race_locales[race])][gender]
+    return random.choice(table['first']) + " " + random.choice(table['last'])
+
+
+# Religions and their probabilities per race (used for both the per-row and the bulk generator)
+religions_by_race = {
+    "west Europe": (['Christian', 'Muslim', 'Jewish'], [0.4, 0.3, 0.3]),
+    "east Europe": (['Christian', 'Muslim', 'Orthodox'], [0.4, 0.3, 0.3]),
+    "Asian": (['Buddhist', 'Hindu', 'Muslim', 'Christian'], [0.3, 0.3, 0.2, 0.2]),
+    "north America": (['Christian', 'Jewish', 'Muslim'], [0.6, 0.2, 0.2]),
+    "latin America": (['Christian', 'Indigenous Religion', 'Jewish'], [0.6, 0.3, 0.1]),
+    "middle East": (['Muslim', 'Christian', 'Jewish'], [0.7, 0.2, 0.1]),
+    "Africa": (['Christian', 'Muslim', 'Indigenous Religion'], [0.5, 0.4, 0.1]),
+}
+
+
+# Function to generate a religion based on race with increased probability for non-"NONE" values
+def generate_religion(race):
+    if race in religions_by_race:
+        religions, weights = religions_by_race[race]
+        return random.choices(religions, weights)[0]
+    return "NONE"
+
+
+# Function to generate an age and adapt other variables
+def generate_age_and_experience():
+    if random.random() < 0.5:
+        return "NONE", "NONE"
+
+    age = random.randint(18, 80)
+
+    if age < 25:
+        max_experience = age - 18
+    elif age < 40:
+        max_experience = age - 20
+    elif age < 60:
+        max_experience = age - 22
+    else:
+        max_experience = age - 25
+
+    years_of_experience = random.randint(0, max_experience)
+
+    if age >= 40 and years_of_experience < 5:
+        years_of_experience = random.randint(5, max_experience)
+
+    return age, years_of_experience
+
+
+# Function to adapt educational degree based on age, considering "NONE" age
+def adapt_education_based_on_age(age):
+    if age == "NONE":
+        return "NONE"
+
+    if age < 22:
+        return maybe_none("Bachelor")
+    elif age < 25:
+        return maybe_none(random.choice(["Bachelor", "Masters"]))
+    elif age < 28:
+        return maybe_none(random.choice(["Bachelor", "Masters", "PhD"]))
+    else:
+        return maybe_none(random.choice(["Bachelor", "Masters", "PhD"]))
+
+
+# Expanded low-end universities list
+experience_types = {
+    'high_end': ['Google', 'Apple', 'Netflix', 'Microsoft', 'Amazon', 'Tesla', 'Facebook', 'Twitter', 'IBM', 'Intel'],
+    'low_end': ['QuickTech Solutions', 'LocalBank', 'Community Health Services', 'EduSupport', 'BasicManufacturing']
+}
+
+college_types = {
+    'high_end': ['Harvard University', 'Stanford University', 'Massachusetts Institute of Technology', 
+                 'University of Cambridge', 'University of Oxford', 'California Institute of Technology', 
+                 'Princeton University', 'Yale University', 'Imperial College London', 'University of Chicago'],
+    'low_end': ['Hometown College', 'Regional Institute', 'City Technical School', 'Springfield Community College',
+                'Greenwood Institute', 'River Valley Technical School', 'Maplewood State College', 'Westside Polytechnic',
+                'Midwest Regional University', 'Easttown Institute of Technology', 'Lakeside Community College',
+                'Northern County College', 'Capital City Institute', 'South Valley Technical School', 'Hilltop State College']
+}
+
+skills_database = {
+    'high_end': ['Python', 'Java', 'C++', 'Cloud Computing', 'Cybersecurity', 'AI/ML', 'Data Science', 'DevOps', 
+                 'Blockchain', 'Networking', 'Mobile Development', 'Machine Learning', 'Natural Language Processing'],
+    'low_end': ['Knitting', 'Gardening', 'Woodworking', 'Photography', 'Cooking', 'Painting', 'Writing', 
+                'Pottery', 'Hiking', 'Bird Watching', 'Fishing', 'Camping', 'Cycling', 'Baking']
+}
+
+
+# Function to generate a random person
+def generate_person():
+    race_for_name = random.choice(['west Europe', 'east Europe', 'north America', 'latin America', 'Asian', 'Africa', 'middle East'])
+    race = maybe_none(race_for_name)
+
+    religion = generate_religion(race)
+
+    gender_for_name = random.choice(['male', 'female'])
+    gender = maybe_none(gender_for_name)
+    first_last_name = maybe_none(generate_name(race_for_name, gender_for_name))
+
+    age, years_of_experience = generate_age_and_experience()
+
+    college_degree = adapt_education_based_on_age(age)
+
+    experience_category = 'high_end' if random.random() > 0.5 else 'low_end'
+    experience_type = maybe_none(random.choice(experience_types[experience_category]))
+    experience_level = experience_category if experience_type != "NONE" else "NONE"
+
+    college_type = "NONE"
+    if experience_category == 'high_end':
+        college_type = maybe_none(random.choice(college_types['high_end']))
+        college_level = 'high_end' if college_type != "NONE" else "NONE"
+    else:
+        college_type = maybe_none(random.choice(college_types['low_end']))
+        college_level = 'low_end' if college_type != "NONE" else "NONE"
+
+    if college_type.startswith("low_end") and college_degree == 'PhD':
+        college_degree = maybe_none("Masters")
+
+    skills = "NONE"
+    skill_level = "NONE"
+
+    if experience_type != "NONE":
+        skills = ', '.join(random.sample(skills_database[experience_level], 5))
+        skill_level = experience_level
+
+    family_status = maybe_none(random.choice(['married', 'single', 'divorced', 'widowed']))
+    sexual_orientation = maybe_none(random.choice(['straight', 'gay', 'bisexual', 'other']))
+
+    return {
+        'first_last_name': first_last_name,
+        'gender': gender,
+        'race': race,
+        'age': age,
+        'family_status': family_status,
+        'religion': religion,
+        'sexual_orientation': sexual_orientation,
+        'years_of_experience': years_of_experience,
+        'experience_type': experience_type,
+        'experience_level': experience_level,
+        'college_degree': college_degree,
+        'college_type': college_type,
+        'college_level': college_level,
+        'skills': skills,
+        'skill_level': skill_level
+    }
+
+
+races = ['west Europe', 'east Europe', 'north America', 'latin America', 'Asian', 'Africa', 'middle East']
+genders = ['male', 'female']
+family_statuses = ['married', 'single', 'divorced', 'widowed']
+sexual_orientations = ['straight', 'gay', 'bisexual', 'other']
+
+
+# Vectorized maybe_none: keep each value with a 50% probability, otherwise "NONE"
+def maybe_none_bulk(rng, values):
+    return np.where(rng.random(len(values)) < 0.5, values, "NONE").astype(object)
+
+
+# Uniform choice from `options` for each of n rows
+def choice_bulk(rng, options, n):
+    return np.asarray(options, dtype=object)[rng.integers(len(options), size=n)]
+
+
+# Uniform choice from the high-end or low-end list depending on each row's category
+def choice_by_category(rng, lists, high_end):
+    return np.where(high_end, choice_bulk(rng, lists['high_end'], len(high_end)),
+                    choice_bulk(rng, lists['low_end'], len(high_end)))
+
+
+def names_bulk(rng, race_for_name, gender_for_name):
+    names = np.empty(len(race_for_name), dtype=object)
+    for race in races:
+        for gender in genders:
+            rows = np.flatnonzero((race_for_name == race) & (gender_for_name == gender))
+            names[rows] = sample_names(race, gender, len(rows), rng)
+    return names
+
+
+# Vectorized generate_age_and_experience: ages and years of experience, each pair "NONE" half of the time
+def ages_and_experience_bulk(rng, n):
+    age = rng.integers(18, 81, size=n)
+    max_experience = np.select([age < 25, age < 40, age < 60], [age - 18, age - 20, age - 22], age - 25)
+    years_of_experience = (rng.random(n) * (max_experience + 1)).astype(np.int64)
+
+    # People aged 40+ with under 5 years of experience draw again between 5 and the maximum
+    redraw = (age >= 40) & (years_of_experience < 5)
+    years_of_experience[redraw] = 5 + (rng.random(redraw.sum()) * (max_experience[redraw] - 4)).astype(np.int64)
+
+    has_age = rng.random(n) >= 0.5
+    return has_age, age, years_of_experience
+
+
+# Vectorized adapt_education_based_on_age: Bachelor under 22, Bachelor/Masters under 25, any degree from 25
+def degrees_bulk(rng, has_age, age):
+    options = np.select([age < 22, age < 25], [1, 2], 3)
+    degree = np.array(["Bachelor", "Masters", "PhD"], dtype=object)[(rng.random(len(age)) * options).astype(np.int64)]
+    return np.where(has_age, maybe_none_bulk(rng, degree), "NONE").astype(object)
+
+
+# Five distinct skills in random order per row from the row's skill level ("NONE" for rows without one)
+def skills_bulk(rng, skill_level, chunk_size=1000000):
+    skills = np.full(len(skill_level), "NONE", dtype=object)
+    for level, options in skills_database.items():
+        rows = np.flatnonzero(skill_level == level)
+        options = np.asarray(options, dtype=object)
+        for start in range(0, len(rows), chunk_size):
+            chunk = rows[start:start + chunk_size]
+            picks = np.argsort(rng.random((len(chunk), len(options))), axis=1)[:, :5]
+            joined = options[picks[:, 0]]
+            for column in range(1, 5):
+                joined = joined + ', ' + options[picks[:, column]]
+            skills[chunk] = joined
+    return skills
+
+
+# Function to generate n people at once, column by column, with the same distributions as generate_person()
+def generate_people(n, rng=None):
+    rng = rng if rng is not None else np.random.default_rng()
+
+    race_for_name = choice_bulk(rng, races, n)
+    race = maybe_none_bulk(rng, race_for_name)
+
+    religion = np.full(n, "NONE", dtype=object)
+    for race_name, (religions, weights) in religions_by_race.items():
+        rows = np.flatnonzero(race == race_name)
+        religion[rows] = rng.choice(np.asarray(religions, dtype=object), size=len(rows), p=weights)
+
+    gender_for_name = choice_bulk(rng, genders, n)
+    gender = maybe_none_bulk(rng, gender_for_name)
+    first_last_name = maybe_none_bulk(rng, names_bulk(rng, race_for_name, gender_for_name))
+
+    has_age, age, years_of_experience = ages_and_experience_bulk(rng, n)
+    college_degree = degrees_bulk(rng, has_age, age)
+
+    high_end = rng.random(n) > 0.5
+    experience_category = np.where(high_end, 'high_end', 'low_end').astype(object)
+    experience_type = maybe_none_bulk(rng, choice_by_category(rng, experience_types, high_end))
+    experience_level = np.where(experience_type != "NONE", experience_category, "NONE").astype(object)
+
+    college_type = maybe_none_bulk(rng, choice_by_category(rng, college_types, high_end))
+    college_level = np.where(college_type != "NONE", experience_category, "NONE").astype(object)
+    # generate_person()'s low-end PhD downgrade checks college_type.startswith("low_end"), which no college
+    # name does, so it never applies; it is left out here to keep the same distribution
+
+    skills = skills_bulk(rng, experience_level)
+    skill_level = experience_level
+
+    family_status = maybe_none_bulk(rng, choice_bulk(rng, family_statuses, n))
+    sexual_orientation = maybe_none_bulk(rng, choice_bulk(rng, sexual_orientations, n))
+
+    return pd.DataFrame({
+        'first_last_name': first_last_name,
+        'gender': gender,
+        'race': race,
+        'age': np.where(has_age, age.astype(object), "NONE").astype(object),
+        'family_status': family_status,
+        'religion': religion,
+        'sexual_orientation': sexual_orientation,
+        'years_of_experience': np.where(has_age, years_of_experience.astype(object), "NONE").astype(object),
+        'experience_type': experience_type,
+        'experience_level': experience_level,
+        'college_degree': college_degree,
+        'college_type': college_type,
+        'college_level': college_level,
+        'skills': skills,
+        'skill_level': skill_level
+    })
+
+
+# Yield n people as DataFrames of at most batch_size rows, drawn one after another from rng
+def iter_people(n, rng, batch_size):
+    for start in range(0, n, batch_size):
+        yield generate_people(min(batch_size, n - start), rng)
+
+
+# Rows per shard. Shard boundaries, and so every shard's seed, depend only on the row count,
+# which keeps the output identical for any number of workers.
+SHARD_SIZE = 100000
+
+# Rows generated and written at a time inside a shard; memory stays bounded by this per worker
+BATCH_SIZE = 10000
+
+
+# Function to generate one shard with its own seed, streaming it batch by batch to its own file
+def generate_shard(shard_file, rows, seed):
+    if not os.path.exists(shard_file):
+        with open_writer(shard_file + '.tmp', parquet=is_parquet(shard_file)) as writer:
+            for batch in iter_people(rows, np.random.default_rng(seed), BATCH_SIZE):
+                writer.write(batch)
+        os.replace(shard_file + '.tmp', shard_file)  # A shard file only ever exists complete
+    return shard_file
+
+
+# Function to generate n people across a process pool and concatenate the shards in order
+# (CSV or, for a .parquet output, Parquet). Shards already on disk from an interrupted run with
+# the same seed are reused.
+def generate_sharded(n, output_file, seed, workers=1, shard_size=SHARD_SIZE):
+    shard_dir = os.path.splitext(output_file)[0] + f'.shards-{seed}-{shard_size}'
+    os.makedirs(shard_dir, exist_ok=True)
+    shard_rows = [min(shard_size, n - start) for start in range(0, n, shard_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(shard_rows))
+    extension = os.path.splitext(output_file)[1]
+    shard_files = [os.path.join(shard_dir, f'part-{i:05d}{extension}') for i in range(len(shard_rows))]
+
+    load_pools()  # Build the name-pool cache once, before the workers read it
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(generate_shard, shard_files, shard_rows, seeds))
+    else:
+        for args in zip(shard_files, shard_rows, seeds):
+            generate_shard(*args)
+
+    concat_files(shard_files, output_file)
+    shutil.rmtree(shard_dir)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generate synthetic personas.")
+    parser.add_argument('rows', nargs='?', type=int, default=1000, help="number of people (default 1000)")
+    parser.add_argument('--seed', type=int, help="seed for a reproducible run (default: random, printed)")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="generator processes")
+    parser.add_argument('--output', default=data_path('synthetic_data_large.csv'), help="CSV, or Parquet for a .parquet file")
+    args = parser.parse_args()
+
+    seed = args.seed if args.seed is not None else np.random.SeedSequence().entropy
+    print(f"Generating {args.rows} people with seed {seed} on {args.workers} workers...")
+    generate_sharded(args.rows, args.output, seed, workers=args.workers)
+
+    print(f"File '{args.output}' has been created.")
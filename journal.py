@@ -0,0 +1,134 @@
+import json
+import os
+import time
+
+import pandas as pd
+
+from run_log import get_logger
+
+log = get_logger('journal')
+
+
+# Append-only JSONL journal with one small record per completed (row, model, task).
+# Lines are flushed immediately but fsync'ed in batches, so a crash can lose at most
+# the last unsynced batch, which is simply redone on the next run.
+class ResultJournal:
+    def __init__(self, path, fsync_every=50, fsync_interval=5.0):
+        self.path = path
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self.unsynced = 0
+        self.last_sync = time.monotonic()
+        self.file = open(path, 'a', encoding='utf-8')
+
+    # Record one completed result; `model` is None for per-row values such as cv_2_id
+    def append(self, row, task, value, model=None):
+        record = {'row': int(row), 'task': task, 'value': _to_json_value(value)}
+        if model is not None:
+            record['model'] = model
+        self.file.write(json.dumps(record) + '\n')
+        self.file.flush()
+        self.unsynced += 1
+        if self.unsynced >= self.fsync_every or time.monotonic() - self.last_sync >= self.fsync_interval:
+            self.sync()
+
+    def sync(self):
+        if self.unsynced:
+            os.fsync(self.file.fileno())
+        self.unsynced = 0
+        self.last_sync = time.monotonic()
+
+    def close(self):
+        if not self.file.closed:
+            self.sync()
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# Convert NumPy/pandas scalars to plain Python values so they can be JSON encoded
+def _to_json_value(value):
+    if hasattr(value, 'item'):
+        return value.item()
+    return value
+
+
+# Column that a journal record belongs to, e.g. 'score~gpt-4o' or 'cv_2_id'
+def record_column(record):
+    if 'model' in record:
+        return f"{record['task']}~{record['model']}"
+    return record['task']
+
+
+# Read every record from a journal; a partially written last line (crash mid-write) is ignored
+def replay(path):
+    records = []
+    if not os.path.exists(path):
+        return records
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                break
+    return records
+
+
+# Write journal records into the wide DataFrame; later records win for the same cell
+def apply_records(df, records):
+    if not records:
+        return df
+    table = pd.DataFrame({
+        'row': [r['row'] for r in records],
+        'column': [record_column(r) for r in records],
+        'value': [r['value'] for r in records],
+    }).drop_duplicates(['row', 'column'], keep='last')
+
+    for column, group in table.groupby('column', sort=False):
+        if column not in df.columns:
+            df[column] = ''
+        # Cast to object first so mixing ints and strings never fails on a typed column
+        if df[column].dtype != object and not pd.api.types.is_numeric_dtype(group['value']):
+            df[column] = df[column].astype(object)
+        df.loc[group['row'].to_numpy(), column] = group['value'].to_numpy()
+    return df
+
+
+# Seed a new journal from a legacy progress CSV so switching to the journal doesn't redo finished work.
+# `id_column` maps rows by a 1-based ID column instead of position, for files that were appended row by row.
+# With `partners` ({row: partner row}) a row's cv_2_id and winner~ values are only imported if the file
+# compared it with that same partner, so a file from another pairing can't mislabel its winners.
+def import_progress_csv(progress_file, journal, columns, id_column=None, partners=None):
+    if not os.path.exists(progress_file):
+        return 0
+    log.info("Importing finished results from %s into %s...", progress_file, journal.path)
+    progress = pd.read_csv(progress_file, usecols=lambda c: c in columns or c == id_column)
+    if id_column is not None:
+        progress = progress.dropna(subset=[id_column]).drop_duplicates(id_column, keep='last')
+        progress.index = progress.pop(id_column).astype(int).to_numpy() - 1
+    done = progress.notna() & (progress.astype(str) != '') & (progress.astype(str) != '0')
+    comparison = [column for column in progress.columns if column == 'cv_2_id' or column.startswith('winner~')]
+    if partners is not None and comparison:
+        expected = pd.Series(partners, dtype=float).reindex(progress.index) + 1
+        if 'cv_2_id' in progress.columns:
+            cv_2_id = pd.to_numeric(progress['cv_2_id'], errors='coerce')
+            other_pairs = (cv_2_id != expected) & ~(cv_2_id.isna() & expected.isna())
+        else:
+            other_pairs = pd.Series(True, index=progress.index)
+        other_pairs &= done[comparison].any(axis=1)
+        if other_pairs.any():
+            log.warning("Skipping the comparisons of %d rows in %s: they were made with other partners",
+                        other_pairs.sum(), progress_file)
+            done.loc[other_pairs, comparison] = False
+    imported = 0
+    for column in progress.columns:
+        task, _, model = column.partition('~')
+        for row, value in progress.loc[done[column], column].items():
+            journal.append(row, task, value, model=model or None)
+            imported += 1
+    journal.sync()
+    return imported
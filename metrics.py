@@ -0,0 +1,241 @@
+import bisect
+import datetime
+import http.server
+import json
+import os
+import threading
+import time
+
+# Upper bounds in seconds of the call latency buckets: hosted calls take well under a second to a
+# few seconds, local models on CPU up to minutes. The percentiles in the summary are estimated from
+# these buckets, so they are only as fine as the buckets around them.
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1, 1.5, 2, 3, 5, 7.5, 10, 15, 20, 30, 60, 120, 300)
+
+# Counters kept per model, with the help text of their exported metric
+COUNTERS = {
+    'calls': 'Backend calls that returned a reply',
+    'errors': 'Backend calls that raised an error',
+    'retries': 'Requests sent again after a rate-limit or transient error',
+    'throttled': 'Rate-limit (429) errors',
+    'failed': 'Requests given up after their last retry',
+    'cache_hits': 'Requests answered from the response cache',
+    'input_tokens': 'Prompt tokens sent to the backend',
+    'output_tokens': 'Reply tokens received from the backend',
+    'rows': 'Results recorded for a row (a score, winner or cover letter)',
+    'unparsed': 'Replies that could not be parsed',
+    'missing_scores': 'CVs a batched rating reply left without a valid score',
+}
+
+PROMETHEUS_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+OPENMETRICS_TYPE = 'application/openmetrics-text; version=1.0.0; charset=utf-8'
+
+
+# Cumulative-bucket histogram in the Prometheus layout (a value equal to a bound goes into that bucket)
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # The last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    # Estimated q-quantile (0 to 1), interpolated within its bucket like Prometheus' histogram_quantile
+    def quantile(self, q):
+        if not self.count:
+            return None
+        rank = q * self.count
+        cumulative, lower = 0, 0.0
+        for bound, count in zip(self.buckets, self.counts):
+            if count and cumulative + count >= rank:
+                return lower + (bound - lower) * (rank - cumulative) / count
+            cumulative += count
+            lower = bound
+        return self.buckets[-1]
+
+    def summary(self):
+        if not self.count:
+            return None
+        return {'mean': self.sum / self.count, 'p50': self.quantile(0.5), 'p95': self.quantile(0.95),
+                'p99': self.quantile(0.99)}
+
+
+# Counters and latency histograms of one model
+class ModelMetrics:
+    def __init__(self):
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.latency = Histogram()  # Total time of the calls that returned a reply
+        self.ttfb = Histogram()     # Time until the response headers arrived (HTTP backends only)
+
+
+# Metrics of one run, per model: call latency histograms, calls, errors, retries, cache hits, tokens
+# in and out, and the rows recorded per second. They are written as a Prometheus text file (e.g. for
+# node_exporter's textfile collector) and a summary JSON, `<path>.metrics.prom` / `<path>.metrics.json`
+# (in AI_BIAS_METRICS_DIR if set), on every engine report and at the end of the run. With
+# AI_BIAS_METRICS_PORT set they are also served live at http://127.0.0.1:<port>/metrics, in the
+# OpenMetrics format for scrapers that ask for it.
+class RunMetrics:
+    def __init__(self, run, path):
+        self.run = run
+        directory = os.environ.get('AI_BIAS_METRICS_DIR')
+        if directory:
+            path = os.path.join(directory, os.path.basename(path))
+        self.prometheus_file = path + '.metrics.prom'
+        self.summary_file = path + '.metrics.json'
+        self.models = {}
+        self.started = None
+        self.server = None
+        self.lock = threading.Lock()  # The endpoint renders from its own thread
+
+    def model(self, label):
+        if label not in self.models:
+            self.models[label] = ModelMetrics()
+        return self.models[label]
+
+    # Start the run clock (the rows/sec denominator) and the endpoint, once
+    def start(self):
+        if self.started is not None:
+            return
+        self.started = time.time()
+        port = os.environ.get('AI_BIAS_METRICS_PORT')
+        if port:
+            self.serve(int(port))
+
+    def elapsed(self):
+        return time.time() - self.started if self.started is not None else 0.0
+
+    def count(self, label, name, amount=1):
+        with self.lock:
+            self.model(label).counters[name] += amount
+
+    # Record every call timed by a connections.LatencyLog under `label`
+    def watch(self, label, latency_log):
+        latency_log.listeners.append(lambda timing: self.observe_call(label, timing))
+
+    def observe_call(self, label, timing):
+        with self.lock:
+            model = self.model(label)
+            if timing.failed:
+                model.counters['errors'] += 1
+                return
+            model.counters['calls'] += 1
+            model.latency.observe(timing.total)
+            if timing.ttfb is not None:
+                model.ttfb.observe(timing.ttfb)
+
+    def rows_per_second(self, label):
+        elapsed = self.elapsed()
+        return self.model(label).counters['rows'] / elapsed if elapsed > 0 else 0.0
+
+    # Exposition text; OpenMetrics names counter families without their _total suffix and ends with # EOF
+    def prometheus(self, openmetrics=False):
+        with self.lock:
+            lines = []
+            run = _label_value(self.run)
+
+            def family(name, kind, help_text, samples):
+                family_name = name[:-len('_total')] if openmetrics and kind == 'counter' else name
+                lines.append(f"# HELP {family_name} {help_text}")
+                lines.append(f"# TYPE {family_name} {kind}")
+                lines.extend(samples)
+
+            for counter, help_text in COUNTERS.items():
+                name = f"ai_bias_{counter}_total"
+                family(name, 'counter', help_text,
+                       [f'{name}{{run="{run}",model="{_label_value(label)}"}} {model.counters[counter]}'
+                        for label, model in self.models.items()])
+
+            for attribute, name, help_text in (('latency', 'ai_bias_call_seconds', 'Latency of the backend calls'),
+                                               ('ttfb', 'ai_bias_time_to_first_byte_seconds',
+                                                'Time until the response headers of a backend call arrived')):
+                samples = []
+                for label, model in self.models.items():
+                    histogram = getattr(model, attribute)
+                    labels = f'run="{run}",model="{_label_value(label)}"'
+                    cumulative = 0
+                    for bound, count in zip(tuple(map(float, histogram.buckets)) + ('+Inf',), histogram.counts):
+                        cumulative += count
+                        samples.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+                    samples.append(f'{name}_sum{{{labels}}} {histogram.sum}')
+                    samples.append(f'{name}_count{{{labels}}} {histogram.count}')
+                family(name, 'histogram', help_text, samples)
+
+            family('ai_bias_rows_per_second', 'gauge', 'Rows recorded per second of the run so far',
+                   [f'ai_bias_rows_per_second{{run="{run}",model="{_label_value(label)}"}} '
+                    f'{self.rows_per_second(label):.4f}' for label in self.models])
+            family('ai_bias_run_seconds', 'gauge', 'Seconds since the run started sending requests',
+                   [f'ai_bias_run_seconds{{run="{run}"}} {self.elapsed():.3f}'])
+            if openmetrics:
+                lines.append('# EOF')
+            return '\n'.join(lines) + '\n'
+
+    def summary(self):
+        with self.lock:
+            models = {}
+            for label, model in self.models.items():
+                models[label] = dict(model.counters, rows_per_second=self.rows_per_second(label),
+                                     latency_seconds=model.latency.summary(), ttfb_seconds=model.ttfb.summary())
+            return {
+                'run': self.run,
+                'started': _timestamp(self.started),
+                'updated': _timestamp(time.time()),
+                'seconds': self.elapsed(),
+                'models': models,
+            }
+
+    # Write both files (atomically, so a scraper never reads half of one); nothing before the run started
+    def write(self):
+        if self.started is None:
+            return
+        _write_atomic(self.prometheus_file, self.prometheus())
+        _write_atomic(self.summary_file, json.dumps(self.summary(), indent=1))
+
+    def serve(self, port, host='127.0.0.1'):
+        metrics = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] not in ('/', '/metrics'):
+                    self.send_error(404)
+                    return
+                openmetrics = 'application/openmetrics-text' in self.headers.get('Accept', '')
+                body = metrics.prometheus(openmetrics).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', OPENMETRICS_TYPE if openmetrics else PROMETHEUS_TYPE)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = http.server.ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    # Write the final files and stop the endpoint
+    def close(self):
+        self.write()
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+
+def _label_value(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _timestamp(seconds):
+    if seconds is None:
+        return None
+    return datetime.datetime.fromtimestamp(seconds, datetime.timezone.utc).isoformat(timespec='seconds')
+
+
+def _write_atomic(path, text):
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp, path)
@@ -0,0 +1,117 @@
+import json
+import os
+import random
+from functools import lru_cache
+
+import numpy as np
+
+# Bump when the way pools are built changes, so cached files from older builds are rebuilt
+NAME_POOL_VERSION = 1
+
+NAME_POOL_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), f'name_pools.v{NAME_POOL_VERSION}.json')
+
+# Mimesis locales each race bucket draws its names from (uniformly), as in generate_name()
+race_locales = {
+    'west Europe': ['en-gb', 'de', 'da'],  # British English, German, Danish
+    'east Europe': ['ru', 'pl'],           # Russian, Polish
+    'Asian': ['zh', 'ja'],                 # Chinese, Japanese
+    'north America': ['en'],               # English (US)
+    'latin America': ['es-mx'],            # Mexican Spanish
+    'middle East': ['fa'],                 # Farsi
+    'Africa': ['africa'],                  # Fixed list below, Mimesis has no African locale
+}
+
+african_names = {
+    'first': ["Kwame", "Tunde", "Amara", "Amina", "Zubair", "Thandi"],
+    'last': ["Kagiso", "Abebe", "Okafor", "Diallo", "Achebe", "Ngugi"],
+}
+
+
+# First and last names of one Mimesis locale and gender, transliterated to ASCII and deduplicated.
+# unidecode works character by character, so transliterating the parts gives the same text as
+# transliterating the full name.
+def _locale_names(locale, gender, max_names=None, seed=0):
+    import unidecode
+    from mimesis import Person
+    from mimesis.locales import Locale
+
+    person = Person(Locale(locale))
+    first_names = person._extract(['names', gender])
+    last_names = person._extract(['surnames'])
+    if isinstance(last_names, dict):  # Some locales (e.g. Russian) have gendered surnames
+        last_names = last_names[gender]
+
+    table = {}
+    for part, names in (('first', first_names), ('last', last_names)):
+        names = sorted({unidecode.unidecode(name) for name in names})
+        if max_names is not None and len(names) > max_names:
+            names = sorted(random.Random(f"{seed}|{locale}|{gender}|{part}").sample(names, max_names))
+        table[part] = names
+    return table
+
+
+# Build every pool: {locale: {gender: {'first': [...], 'last': [...]}}}. max_names caps each table
+# (chosen reproducibly from `seed`) to control pool size and name collision rates.
+def build_pools(max_names=None, seed=0):
+    pools = {}
+    for locales in race_locales.values():
+        for locale in locales:
+            if locale == 'africa':
+                pools[locale] = {gender: african_names for gender in ('male', 'female')}
+            else:
+                pools[locale] = {gender: _locale_names(locale, gender, max_names, seed)
+                                 for gender in ('male', 'female')}
+    return pools
+
+
+def _pool_meta(max_names, seed):
+    import mimesis
+
+    return {'version': NAME_POOL_VERSION, 'mimesis': mimesis.__version__, 'max_names': max_names, 'seed': seed}
+
+
+# Load the pools from the on-disk cache, building and saving them first if the cache is missing
+# or was built by another pool version, Mimesis version or size setting
+@lru_cache(maxsize=None)
+def load_pools(path=NAME_POOL_FILE, max_names=None, seed=0):
+    meta = _pool_meta(max_names, seed)
+    if os.path.exists(path):
+        with open(path, encoding='utf-8') as f:
+            cached = json.load(f)
+        if cached.get('meta') == meta:
+            return _as_arrays(cached['pools'])
+
+    pools = build_pools(max_names, seed)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'meta': meta, 'pools': pools}, f)
+    os.replace(tmp_path, path)
+    return _as_arrays(pools)
+
+
+def _as_arrays(pools):
+    return {locale: {gender: {part: np.array(names, dtype=object) for part, names in table.items()}
+                     for gender, table in genders.items()}
+            for locale, genders in pools.items()}
+
+
+# Draw `size` full names for one race bucket and gender: a locale per name, then a first and a last name
+def sample_names(race, gender, size, rng, pools=None):
+    pools = pools if pools is not None else load_pools()
+    locales = race_locales[race]
+    names = np.empty(size, dtype=object)
+    locale_index = rng.integers(len(locales), size=size)
+    for i, locale in enumerate(locales):
+        rows = np.flatnonzero(locale_index == i)
+        table = pools[locale][gender]
+        first = table['first'][rng.integers(len(table['first']), size=len(rows))]
+        last = table['last'][rng.integers(len(table['last']), size=len(rows))]
+        names[rows] = first + ' ' + last
+    return names
+
+
+# Upper bound on the distinct full names a race bucket and gender can produce (for judging collision rates)
+def distinct_names(race, gender, pools=None):
+    pools = pools if pools is not None else load_pools()
+    return sum(len(pools[locale][gender]['first']) * len(pools[locale][gender]['last'])
+               for locale in race_locales[race])
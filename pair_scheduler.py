@@ -0,0 +1,142 @@
+import numpy as np
+import pandas as pd
+
+from analysis import CONTROL_ATTRIBUTES, PROTECTED_ATTRIBUTES, encode, prepare_attributes, winner_matrix
+from ranking import BradleyTerry
+
+# z of the 95% intervals the scheduler narrows
+Z = 1.96
+
+
+# Adaptive choice of comparison partners, a round at a time.
+#
+# The effects it measures are the win rates of every protected attribute value (as in
+# analysis.win_rates), for every model. A comparison between CVs that differ in d attributes
+# (counting design factors: experience, college and skill level) confounds d effects, so it counts
+# as 1/d of a comparison for each of them; a pair differing in exactly one protected attribute with
+# the same design is a full comparison for that attribute. Each round pairs the rows carrying the
+# values furthest above the target with the partner that narrows those intervals most per call,
+# weighted by how uncertain the outcome is under the current Bradley-Terry strengths (a pair whose
+# winner is already clear teaches little). The run stops once every interval is at most
+# `target_width` wide, leaving the remaining rows without a comparison.
+class PairScheduler:
+    def __init__(self, df, models, target_width=0.4, round_size=100, seed=0):
+        columns = [column for column in PROTECTED_ATTRIBUTES if column != 'age_band'] + ['age'] + CONTROL_ATTRIBUTES
+        attributes = prepare_attributes(df[columns].copy())
+        self.codes, self.levels, _ = encode(attributes)
+        self.controls = np.stack([pd.factorize(attributes[column])[0] for column in CONTROL_ATTRIBUTES], axis=1)
+        self.models = models
+        self.target_width = target_width
+        self.round_size = round_size
+        self.rng = np.random.default_rng(seed)
+
+        n = len(df)
+        self.partners = {}
+        self.opponents = {}  # row: rows it was already compared with
+        self.wins = np.zeros((len(self.levels), len(models)))
+        self.compared = np.zeros((len(self.levels), len(models)))
+        self.solvers = [BradleyTerry() for _ in models]
+        self.ranked = np.zeros((n, len(models)), dtype=bool)
+        self.strengths = np.zeros((n, len(models)))
+
+        # Values every row shares can't be compared, so they never hold the run up
+        self.comparable = np.bincount(self.codes.ravel(), minlength=len(self.levels)) < n
+
+    # Number of attributes (protected and design) rows `a` differ from rows `b` in
+    def _distance(self, a, b):
+        return (self.codes[a] != self.codes[b]).sum(axis=-1) + (self.controls[a] != self.controls[b]).sum(axis=-1)
+
+    # Register partners chosen earlier (e.g. replayed from the journal)
+    def add_partners(self, partners):
+        for row, partner in partners.items():
+            self.partners[row] = partner
+            self.opponents.setdefault(row, set()).add(partner)
+            self.opponents.setdefault(partner, set()).add(row)
+
+    # Recount the effects and update the strengths from the winners recorded in df so far
+    def update(self, df):
+        rows = np.array(sorted(self.partners), dtype=np.int64)
+        partners = np.array([self.partners[row] for row in rows], dtype=np.int64)
+        winners = winner_matrix(df, self.models)[rows]
+        first, second = self.codes[rows], self.codes[partners]
+        differ = first != second
+        weight = np.broadcast_to((1 / np.maximum(self._distance(rows, partners), 1))[:, None], differ.shape)
+
+        levels = len(self.levels)
+        for m in range(len(self.models)):
+            decided = ~np.isnan(winners[:, m])
+            first_won = (winners[:, m] == 1)[:, None]
+            won = np.where(first_won, first, second)
+            lost = np.where(first_won, second, first)
+            mask = differ & decided[:, None]
+            self.wins[:, m] = np.bincount(won[mask], weight[mask], minlength=levels)
+            self.compared[:, m] = self.wins[:, m] + np.bincount(lost[mask], weight[mask], minlength=levels)
+
+            # Only the newly decided comparisons go into the (incremental) ranking
+            new = decided & ~self.ranked[rows, m]
+            if new.any():
+                winner_rows = np.where(first_won[:, 0], rows, partners)[new]
+                loser_rows = np.where(first_won[:, 0], partners, rows)[new]
+                solver = self.solvers[m].add(winner_rows, loser_rows).fit()
+                self.ranked[rows[new], m] = True
+                self.strengths[solver.ids.to_numpy(dtype=np.int64), m] = solver.theta
+
+    # Width of the Wilson interval of every value's win rate on its effective (1/d-weighted) number of
+    # comparisons, for the model where it is widest; `pending` adds comparisons already assigned but not
+    # answered yet. Unlike the normal approximation it stays within [0, 1] for small or fractional counts.
+    def widths(self, pending=0):
+        compared = self.compared + np.asarray(pending).reshape(-1, 1)
+        rate = np.where(self.compared > 0, self.wins / np.maximum(self.compared, 1e-9), 0.5)
+        n = np.maximum(compared, 1e-9)
+        width = 2 * Z * np.sqrt(rate * (1 - rate) / n + Z ** 2 / (4 * n ** 2)) / (1 + Z ** 2 / n)
+        width = np.where(compared > 0, width, 1.0)
+        return np.where(self.comparable, width.max(axis=1), 0.0)
+
+    def done(self):
+        return self.widths().max(initial=0) <= self.target_width or len(self.partners) == len(self.codes)
+
+    # Partner for `row` that narrows the intervals still above target the most per call, with the
+    # least predictable outcome; `need` is how far each interval is above the target
+    def best_partner(self, row, need):
+        differ = self.codes != self.codes[row]
+        gain = (need[self.codes] + need[self.codes[row]]) / 2 * differ
+        score = gain.sum(axis=1) / np.maximum(self._distance(row, slice(None)), 1)
+        win_probability = 1 / (1 + np.exp(self.strengths - self.strengths[row]))
+        score *= 4 * (win_probability * (1 - win_probability)).mean(axis=1)
+
+        # Never the row itself, an identical profile or a pair that was already compared
+        score[~differ.any(axis=1)] = -np.inf
+        score[row] = -np.inf
+        score[list(self.opponents.get(row, ()))] = -np.inf
+        if not np.isfinite(score).any():
+            return int(self.rng.choice(np.delete(np.arange(len(score)), row)))
+        return int(np.argmax(score + 1e-9 * self.rng.random(len(score))))
+
+    # Choose the next round of pairs and return {row: partner}
+    def next_round(self):
+        unpaired = np.setdiff1d(np.arange(len(self.codes)), list(self.partners))
+        pending = np.zeros(len(self.levels))
+        need = np.maximum(self.widths() - self.target_width, 0)
+
+        # Rows carrying the values furthest from the target go first
+        order = unpaired[np.argsort(-need[self.codes[unpaired]].max(axis=1), kind='stable')]
+        chosen = {}
+        for row in order[:self.round_size]:
+            need = np.maximum(self.widths(pending) - self.target_width, 0)
+            if not need.any():
+                break
+            partner = self.best_partner(row, need)
+            chosen[int(row)] = partner
+            differ = self.codes[row] != self.codes[partner]
+            weight = 1 / max(self._distance(row, partner), 1)
+            np.add.at(pending, self.codes[row][differ], weight)
+            np.add.at(pending, self.codes[partner][differ], weight)
+        self.add_partners(chosen)
+        return chosen
+
+    def summary(self):
+        need = self.widths()
+        widest = int(np.argmax(need)) if len(need) else 0
+        attribute, value = self.levels[widest]
+        return (f"{len(self.partners)} pairs, widest win-rate interval {need[widest]:.2f} "
+                f"({attribute}={value}), target {self.target_width:.2f}")
@@ -0,0 +1,579 @@
+import asyncio
+import os
+import random
+from collections import Counter
+
+import pandas as pd
+
+import journal
+from connections import pooled_clients
+from batch_api import BatchRun, make_custom_id, parse_custom_id
+from metrics import RunMetrics
+from prompts import rating_prompt, batch_rating_prompt, comparison_prompt, combined_prompt
+from pair_scheduler import PairScheduler
+from providers import JSON_MODE, OpenAIProvider
+from response_cache import ResponseCache
+from response_format import COMBINED, SCORE, WINNER, ScoreBatchFormat
+from run_log import RateLimitedLogger, get_logger
+from scoring_engine import Job, ScoringEngine, make_budgets
+from storage import data_path, read_table, write_table
+from token_budget import BATCH_DISCOUNT, RunPlan, TokenCounter
+from work_queue import WorkQueue, plan_units, row_values
+
+log = get_logger('pipeline')
+
+# Call modes: 'separate' rates CV 1 alone and then asks for the winner (the hosted-model scripts);
+# 'combined' asks for both scores and the winner in one prompt (the local-model scripts, and the
+# hosted ones with AI_BIAS_CALL_MODE=combined), which halves the requests per row. The mode that
+# produced a row's score~/winner~ values is recorded in its call_mode~<model> column.
+CALL_MODES = ('separate', 'combined')
+
+# Results whose prompt format ('json' for the structured-output prompts, 'plain' for the original
+# plain-text ones) is recorded in a <task>_prompt~<model> column, e.g. score_prompt~gpt-4o
+PROMPT_FORMAT_TASKS = ('score', 'winner')
+
+# Pairings: 'next' compares row i with row i + 1; 'random' compares each row with one randomly drawn other row;
+# 'active' chooses partners a round at a time from the results so far and stops once the bias
+# estimates are precise enough (see pair_scheduler.py)
+PAIRINGS = ('next', 'random', 'active')
+
+
+# Load the generated cover letters and add the ID, comparison and per-model result columns
+def load_input(input_file, labels):
+    log.info("Loading %s...", input_file)
+    df = read_table(input_file)
+
+    # Add ID column as the first column (keeping the original row index)
+    df['ID'] = df.index + 1  # Adding 1 to start ID from 1 instead of 0
+
+    # Add columns for the scores, winner, and the CV IDs for comparison
+    df['cv_1_id'] = df['ID']
+    df['cv_2_id'] = ''
+    for label in labels:
+        df[f'score~{label}'] = 0
+        df[f'winner~{label}'] = ''
+        df[f'call_mode~{label}'] = ''
+        for task in PROMPT_FORMAT_TASKS:
+            df[f'{task}_prompt~{label}'] = ''
+    return df
+
+
+# Call mode picked with AI_BIAS_CALL_MODE (`default` when unset) and the output file for it: a run in
+# another mode than the script's usual one writes to its own file, e.g. ..._gpt_combined.csv, so the
+# results of both methods can be compared
+def selected_call_mode(output_file, default='separate'):
+    call_mode = os.environ.get('AI_BIAS_CALL_MODE', default)
+    if call_mode != default:
+        base, extension = os.path.splitext(output_file)
+        output_file = f"{base}_{call_mode}{extension}"
+    return call_mode, output_file
+
+
+# Choose the CV each row is compared with and return {row: partner row}. Random partners are
+# drawn once and journaled, so a restarted run compares every row against the same CV.
+def assign_partners(df, pairing, records, result_journal):
+    n = len(df)
+    if pairing == 'next':
+        df['cv_2_id'] = df['ID'].shift(-1, fill_value='N/A')
+        return next_partners(n)
+
+    partners = journaled_partners(records)
+    for index in range(n):
+        if index not in partners and n > 1:
+            random_index = random.randrange(n - 1)
+            random_index += random_index >= index  # Skip over the current CV
+            partners[index] = random_index
+            result_journal.append(index, 'cv_2_id', random_index + 1)
+    rows = sorted(partners)
+    df.loc[rows, 'cv_2_id'] = [partners[row] + 1 for row in rows]
+    return partners
+
+
+# {row: partner row} of the 'next' pairing
+def next_partners(n):
+    return {index: index + 1 for index in range(n - 1)}
+
+
+# {row: partner row} of the partners an earlier run journaled
+def journaled_partners(records):
+    partners = {}
+    for row, cv_id in row_values(records, 'cv_2_id').items():
+        if pd.notna(pd.to_numeric(cv_id, errors='coerce')):
+            partners[row] = int(float(cv_id)) - 1
+    return partners
+
+
+# Shared evaluation pipeline behind every compare script: the backends differ, while pairing,
+# work queue, journal, response cache, rate budgets and parsing are the same for all of them
+class ComparisonPipeline:
+    def __init__(self, providers, output_file, input_file='synthetic_data_large_with_cv.csv',
+                 pairing='next', call_mode='separate', rate_limits=None, concurrency=16,
+                 journal_file=None, legacy_progress_file=None, legacy_id_column=None,
+                 use_batch_api=False, batch_state_file=None, cache=None, target_width=0.4, round_size=100,
+                 parse_retries=2, score_batch_size=1, score_batch_tokens=8000, plan_only=None):
+        if pairing not in PAIRINGS:
+            raise ValueError(f"Unknown pairing {pairing!r}, expected one of {PAIRINGS}")
+        if call_mode not in CALL_MODES:
+            raise ValueError(f"Unknown call mode {call_mode!r}, expected one of {CALL_MODES}")
+        if use_batch_api and not all(isinstance(p, OpenAIProvider) for p in providers):
+            raise ValueError("The Batch API mode only supports OpenAI providers")
+        if use_batch_api and pairing == 'active':
+            raise ValueError("Active pairing needs the answers of each round before the next one; use live calls")
+        if score_batch_size > 1 and (call_mode != 'separate' or use_batch_api):
+            raise ValueError("Batched scoring needs the separate call mode and live calls")
+
+        self.providers = {provider.label: provider for provider in providers}
+        # Data files follow AI_BIAS_FORMAT (CSV or Parquet); the journal and batch state keep one name for both
+        base_name = os.path.splitext(output_file)[0]
+        self.output_file = data_path(output_file)
+        self.input_file = data_path(input_file)
+        self.pairing = pairing
+        self.call_mode = call_mode
+        self.rate_limits = rate_limits or {}
+        self.concurrency = concurrency
+        self.journal_file = journal_file or base_name + '.journal.jsonl'
+        self.legacy_progress_file = legacy_progress_file or output_file
+        self.legacy_id_column = legacy_id_column
+        self.use_batch_api = use_batch_api
+        self.batch_state_file = batch_state_file or base_name + '.batches.json'
+        self.batch_prefix = base_name + '.batch'
+        self.cache = cache or ResponseCache()
+        # Active pairing only: stop once every win-rate interval is this narrow; pairs per round
+        self.target_width = target_width
+        self.round_size = round_size
+        # Times a reply that doesn't parse is requested again within a run; per-model count of such replies,
+        # and of the CVs a batched rating reply left without a valid score
+        self.parse_retries = parse_retries
+        self.parse_failures = Counter()
+        self.missing_scores = Counter()
+        # Cover letters rated per request (1 rates each CV on its own), and the token budget of such a request
+        self.score_batch_size = score_batch_size
+        self.score_batch_tokens = score_batch_tokens
+        # Token counts of the cover letters (cached on disk) and of the prompt text around them
+        self.token_counter = TokenCounter()
+        self.template_tokens = {}
+        # With AI_BIAS_PLAN_ONLY=1 (or plan_only=True) a run stops after printing the projected tokens and cost
+        if plan_only is None:
+            plan_only = os.environ.get('AI_BIAS_PLAN_ONLY', '') == '1'
+        self.plan_only = plan_only
+        # Per-model call latency, tokens, retries, cache hits and rows/sec, written next to the output
+        # (see metrics.py); progress lines are rate-limited so they never slow the run down
+        self.metrics = RunMetrics(os.path.basename(base_name), base_name)
+        for label, provider in self.providers.items():
+            self.metrics.watch(label, provider.latency)
+        self.progress = RateLimitedLogger(log, note_skipped=False)
+
+    # Reply format of a task's prompt (see response_format.py)
+    def reply_format(self, task):
+        if self.call_mode == 'combined':
+            return COMBINED
+        return SCORE if task == 'score' else WINNER
+
+    # Prompt of a task for the given cover letters (CV 1 first), asking for a JSON reply if the
+    # model's provider has structured output
+    def build_prompt(self, label, task, letters):
+        json_reply = self.providers[label].structured_output
+        if self.call_mode == 'combined':
+            return combined_prompt(letters[0], letters[1], json_reply)
+        if task == 'score':
+            return rating_prompt(letters[0], json_reply)
+        return comparison_prompt(letters[0], letters[1], json_reply)
+
+    # Rows whose cover letters go into a unit's prompt
+    def unit_rows(self, index, task):
+        if self.call_mode == 'separate' and task == 'score':
+            return [index]
+        return [index, self.partners[index]]
+
+    # Prompt for one queued unit
+    def unit_prompt(self, index, label, task):
+        return self.build_prompt(label, task, [self.cv_texts[row] for row in self.unit_rows(index, task)])
+
+    def count_tokens(self, label, text, cache=True):
+        provider = self.providers[label]
+        return self.token_counter.count(provider.name, provider.model, text, cache)
+
+    # Tokens of a prompt template without its cover letters, counted once per model
+    def template_size(self, label, key, template):
+        if (label, key) not in self.template_tokens:
+            self.template_tokens[label, key] = self.count_tokens(label, template)
+        return self.template_tokens[label, key]
+
+    # Prompt tokens of a unit: the (cached) counts of its cover letters plus the prompt around them
+    def unit_tokens(self, index, label, task):
+        rows = self.unit_rows(index, task)
+        template = self.template_size(label, task, self.build_prompt(label, task, [''] * len(rows)))
+        return template + sum(self.count_tokens(label, self.cv_texts[row]) for row in rows)
+
+    # Prompt tokens a cover letter adds to a batched rating prompt (the letter and its "CV <ID>:" header)
+    def batch_letter_tokens(self, label, row):
+        header = self.template_size(label, 'score_batch_letter', f"\n\nCV {row + 1}:\n")
+        return header + self.count_tokens(label, self.cv_texts[row])
+
+    # Parse a reply into {task: value}; an empty dict means the reply couldn't be parsed
+    def parse_reply(self, task, response_text):
+        return self.reply_format(task).parse(response_text)
+
+    # Prompt format behind a model's results: 'json' with structured output, else 'plain'
+    def prompt_format(self, label):
+        return 'json' if self.providers[label].structured_output else 'plain'
+
+    # Write parsed results into their score~/winner~ columns, with the call mode and prompt format that
+    # produced them, and append them to the journal. For results that didn't parse nothing is written
+    # and False is returned, so the unit stays pending.
+    def record(self, index, label, results):
+        if not results:
+            return False
+        for task, value in results.items():
+            if task == 'partner_score':
+                self.record_partner_score(index, label, value)
+                continue
+            self.df.loc[index, f'{task}~{label}'] = value
+            self.result_journal.append(index, task, value, model=label)
+            if task in PROMPT_FORMAT_TASKS:
+                self.record_label(index, label, f'{task}_prompt', self.prompt_format(label))
+        self.record_label(index, label, 'call_mode', self.call_mode)
+        self.metrics.count(label, 'rows')
+        return True
+
+    # Write and journal a label of a row's results (call mode, prompt format) unless it already has it
+    def record_label(self, index, label, task, value):
+        if self.df.loc[index, f'{task}~{label}'] != value:
+            self.df.loc[index, f'{task}~{label}'] = value
+            self.result_journal.append(index, task, value, model=label)
+
+    # Results imported from an old progress file were produced in this run's call mode by the original
+    # scripts' plain-text prompts; label them like new results, so the two formats can be told apart
+    def label_imported(self, records):
+        for record in records:
+            if record.get('model') in self.providers and record['task'] in PROMPT_FORMAT_TASKS:
+                self.record_label(record['row'], record['model'], f"{record['task']}_prompt", 'plain')
+                self.record_label(record['row'], record['model'], 'call_mode', self.call_mode)
+        self.result_journal.sync()
+
+    # Count a reply that couldn't be parsed (once per request) and, for a batched rating reply, the CVs
+    # it left without a score
+    def count_unparsed(self, label, missing_scores=0):
+        self.parse_failures[label] += 1
+        self.metrics.count(label, 'unparsed')
+        if missing_scores:
+            self.missing_scores[label] += missing_scores
+            self.metrics.count(label, 'missing_scores', missing_scores)
+
+    # Combined prompts also score CV 2. As in the original local-model scripts, that score goes into the
+    # partner's score~ column, but only while the partner has no score as CV 1 of its own (which always
+    # wins, also on replay since it is journaled later); so with `next` pairing the last row gets one too.
+    def record_partner_score(self, index, label, value):
+        partner = self.partners.get(index)
+        if partner is None or pd.to_numeric(self.df.loc[partner, f'score~{label}'], errors='coerce') > 0:
+            return
+        self.df.loc[partner, f'score~{label}'] = value
+        self.result_journal.append(partner, 'score', value, model=label)
+        self.record_label(partner, label, 'score_prompt', self.prompt_format(label))
+        self.record_label(partner, label, 'call_mode', self.call_mode)
+
+    # Reply to a prompt from the cache or the backend, counting the cache hit or the tokens sent and received
+    async def ask(self, provider, prompt, reply_format, input_tokens, refresh=False):
+        fetched = []
+
+        async def fetch():
+            reply = await provider.timed_complete(prompt, reply_format)
+            fetched.append(reply)
+            self.metrics.count(provider.label, 'input_tokens', input_tokens)
+            self.metrics.count(provider.label, 'output_tokens', self.count_tokens(provider.label, reply, cache=False))
+            return reply
+
+        reply = await self.cache.acall(provider.name, provider.model, prompt, fetch,
+                                       temperature=provider.temperature, refresh=refresh)
+        if not fetched:
+            self.metrics.count(provider.label, 'cache_hits')
+        return reply
+
+    # Job for one unit; its call returns {row: parsed results}
+    def make_job(self, index, label, task, refresh=False):
+        provider = self.providers[label]
+        prompt = self.unit_prompt(index, label, task)
+        reply_format = self.reply_format(task) if provider.structured_output else None
+        input_tokens = self.unit_tokens(index, label, task)
+
+        async def call():
+            response_text = await self.ask(provider, prompt, reply_format, input_tokens, refresh)
+            return {index: self.parse_reply(task, response_text)}
+        return Job(index, label, task, prompt, call, input_tokens=input_tokens,
+                   output_tokens=self.reply_format(task).max_tokens)
+
+    # Job rating several CVs in one request. The letters are shuffled (with a seed fixed by the batch,
+    # so a rerun sends the same prompt) and every score is recorded with its letter's position and the
+    # batch size, in the score_position~/score_batch~ columns, so position effects can be measured.
+    def make_score_batch_job(self, rows, label, refresh=False):
+        provider = self.providers[label]
+        order = list(rows)
+        random.Random(f"{label}:{rows}").shuffle(order)
+        prompt = batch_rating_prompt([(row + 1, self.cv_texts[row]) for row in order], provider.structured_output)
+        reply_format = ScoreBatchFormat([row + 1 for row in order])
+        position = {row: i + 1 for i, row in enumerate(order)}
+        input_tokens = self.batch_template_tokens(label) + sum(self.batch_letter_tokens(label, row) for row in rows)
+
+        async def call():
+            response_text = await self.ask(provider, prompt, reply_format if provider.structured_output else None,
+                                           input_tokens, refresh)
+            scores = reply_format.parse(response_text)
+            return {row: {'score': scores[row + 1], 'score_position': position[row], 'score_batch': len(order)}
+                    if row + 1 in scores else {} for row in rows}
+        return Job(rows[0], label, 'score', prompt, call, input_tokens=input_tokens, output_tokens=reply_format.max_tokens)
+
+    # Prompt tokens of a batched rating prompt without any letters (the reply is the Job's output_tokens)
+    def batch_template_tokens(self, label):
+        empty = batch_rating_prompt([], self.providers[label].structured_output)
+        return self.template_size(label, 'score_batch', empty)
+
+    # Split rows into rating batches of at most score_batch_size letters whose requests (prompt and
+    # reply) stay within score_batch_tokens; a letter longer than that is rated on its own
+    def score_batches(self, label, rows):
+        template = self.batch_template_tokens(label)
+        batch, letter_tokens = [], 0
+        for row in rows:
+            size = self.batch_letter_tokens(label, row)
+            reply = ScoreBatchFormat(batch + [row]).max_tokens
+            if batch and (len(batch) >= self.score_batch_size
+                          or template + letter_tokens + size + reply > self.score_batch_tokens):
+                yield batch
+                batch, letter_tokens = [], 0
+            batch.append(row)
+            letter_tokens += size
+        if batch:
+            yield batch
+
+    # Jobs for the units: one request each, except that with score_batch_size > 1 the score units of
+    # each model are packed into batched rating requests
+    def make_jobs(self, units, refresh=False):
+        if self.score_batch_size <= 1:
+            return [self.make_job(index, label, task, refresh) for index, label, task in units]
+        jobs, score_rows = [], {}
+        for index, label, task in units:
+            if task == 'score':
+                score_rows.setdefault(label, []).append(index)
+            else:
+                jobs.append(self.make_job(index, label, task, refresh))
+        for label, rows in score_rows.items():
+            jobs.extend(self.make_score_batch_job(batch, label, refresh) for batch in self.score_batches(label, rows))
+        return jobs
+
+    # Log the projected requests, tokens (prompt and the most the replies may use) and cost per model,
+    # and for live calls the time they take within the rate limits
+    def report_plan(self, jobs, batch=False):
+        plan = RunPlan(None, BATCH_DISCOUNT) if batch else RunPlan(self.rate_limits)
+        plan.add_jobs(jobs)
+        self.token_counter.save()
+        models = {label: provider.model for label, provider in self.providers.items()}
+        tokenizers = sorted({self.token_counter.tokenizer(provider.name, provider.model)
+                             for provider in self.providers.values()})
+        log.info("Plan (tokens counted with %s):\n%s", ', '.join(tokenizers), plan.summary(models))
+
+    # Send the jobs' requests and return the units whose replies couldn't be parsed
+    def send(self, jobs):
+        unparsed = []
+
+        def on_result(job, results):
+            missing = [index for index, row_results in results.items()
+                       if not self.record(index, job.model, row_results)]
+            if missing:
+                self.count_unparsed(job.model, len(missing) if len(results) > 1 else 0)
+                unparsed.extend((index, job.model, job.task) for index in missing)
+            log.debug("Finished %s for row %d with %s", job.task, job.index + 1, job.model)
+            rates = ', '.join(f"{label} {self.metrics.rows_per_second(label):.1f}" for label in self.providers)
+            self.progress.info("Progress journaled after %d of %d requests (rows/s: %s)", engine.completed, len(jobs), rates)
+
+        log.info("Sending %d requests across %d models...", len(jobs), len(self.providers))
+        self.metrics.start()
+        engine = ScoringEngine(make_budgets(self.rate_limits), concurrency=self.concurrency, metrics=self.metrics)
+
+        async def run_jobs():
+            async with pooled_clients(self.providers.values()):
+                await engine.run(jobs, on_result)
+
+        asyncio.run(run_jobs())
+        log.info("Finished %d requests, %d failed, %d unparsed (%d answered from cache)",
+                 engine.completed, engine.failed, len(unparsed), self.cache.hits)
+        self.metrics.write()
+        return unparsed
+
+    # Print the plan, then send the queue. Only the units whose reply didn't parse are sent again (skipping
+    # their cached replies), not the rest of their row, and each in a request of its own (a CV left out of
+    # a batched rating reply is rated alone); whatever still fails after parse_retries stays pending for
+    # the next run.
+    def run_live(self, queue):
+        jobs = self.make_jobs(list(queue))
+        self.report_plan(jobs)
+        if self.plan_only:
+            return
+        units = self.send(jobs)
+        for attempt in range(1, self.parse_retries + 1):
+            if not units:
+                break
+            log.info("Re-sending %d unparsed requests (retry %d of %d)", len(units), attempt, self.parse_retries)
+            units = self.send([self.make_job(index, label, task, refresh=True) for index, label, task in units])
+        for label, provider in self.providers.items():
+            log.info("[%s] latency: %s, %d unparsed replies (%d CVs missing from batched ratings)", label,
+                     provider.latency.summary(), self.parse_failures[label], self.missing_scores[label])
+
+    def run_batch(self, queue):
+        units = list(queue)
+        self.report_plan(self.make_jobs(units), batch=True)
+        if self.plan_only:
+            return
+        self.metrics.start()
+        for attempt in range(self.parse_retries + 1):
+            if attempt:
+                log.info("Resubmitting %d unparsed requests (retry %d of %d)", len(units), attempt, self.parse_retries)
+            units = self.send_batch(units, attempt)
+            if not units:
+                break
+        log.info("Finished batch mode (%d answered from cache, unparsed replies: %s)",
+                 self.cache.hits, dict(self.parse_failures))
+
+    # One Batch API round over `units`; returns the units whose replies couldn't be parsed
+    def send_batch(self, units, attempt):
+        # Answer what the cache already knows (on the first round), and pack everything else into batch job files
+        batch_requests = []
+        for index, label, task in units:
+            provider = self.providers[label]
+            prompt = self.unit_prompt(index, label, task)
+            cached = None if attempt else self.cache.get(provider.name, provider.model, prompt,
+                                                         temperature=provider.temperature)
+            if cached is not None:
+                self.metrics.count(label, 'cache_hits')
+                if self.record(index, label, self.parse_reply(task, cached)):
+                    continue
+                self.count_unparsed(label)
+            response_format, max_tokens = None, None
+            if provider.structured_output:
+                response_format, max_tokens = JSON_MODE, self.reply_format(task).max_tokens
+            batch_requests.append((make_custom_id(task, index, label), provider.model, prompt,
+                                   provider.temperature, response_format, max_tokens))
+
+        # Merge each batch answer back into its column by custom_id (batch answers have no latency to record)
+        unparsed = []
+
+        def on_batch_result(custom_id, response_text):
+            task, index, label = parse_custom_id(custom_id)
+            provider = self.providers[label]
+            self.cache.put(provider.name, provider.model, self.unit_prompt(index, label, task), response_text,
+                           temperature=provider.temperature)
+            self.metrics.count(label, 'calls')
+            self.metrics.count(label, 'input_tokens', self.unit_tokens(index, label, task))
+            self.metrics.count(label, 'output_tokens', self.count_tokens(label, response_text, cache=False))
+            if not self.record(index, label, self.parse_reply(task, response_text)):
+                self.count_unparsed(label)
+                unparsed.append((index, label, task))
+
+        batch_run = BatchRun(self.batch_state_file)
+        batch_run.submit(batch_requests, f"{self.batch_prefix}.retry{attempt}" if attempt else self.batch_prefix)
+        batch_run.wait_and_merge(on_batch_result)
+        return unparsed
+
+    # Active pairing: query the journaled pairs (and every score) first, then keep choosing the
+    # next round of partners from the answers so far until the scheduler is satisfied
+    def run_active(self, records, labels):
+        scheduler = PairScheduler(self.df, labels, target_width=self.target_width, round_size=self.round_size)
+        self.partners = journaled_partners(records)
+        scheduler.add_partners(self.partners)
+        self.set_partners(self.partners)
+
+        score_rows = range(len(self.df)) if self.call_mode == 'separate' else []
+        queue = WorkQueue(plan_units({'score': score_rows, 'winner': sorted(self.partners)}, labels), records)
+        while True:
+            if len(queue):
+                self.run_live(queue)
+            if self.plan_only:
+                log.info("Active pairing chooses the further comparisons from the answers, so they aren't in the plan")
+                return
+            scheduler.update(self.df)
+            log.info("Active pairing: %s", scheduler.summary())
+            if scheduler.done():
+                break
+
+            partners = scheduler.next_round()
+            if not partners:
+                break
+            for index, partner in partners.items():
+                self.result_journal.append(index, 'cv_2_id', partner + 1)
+            self.partners.update(partners)
+            self.set_partners(partners)
+            queue = WorkQueue(plan_units({'winner': sorted(partners)}, labels), [])
+        log.info("Active pairing compared %d of %d CVs", len(self.partners), len(self.df))
+
+    def set_partners(self, partners):
+        rows = sorted(partners)
+        self.df.loc[rows, 'cv_2_id'] = [partners[row] + 1 for row in rows]
+
+    def run(self):
+        labels = list(self.providers)
+        self.df = load_input(self.input_file, labels)
+
+        # Replay finished results from the journal (importing an old progress file the first time, without
+        # the comparisons it made with other partners than the 'next' pairing's)
+        self.result_journal = journal.ResultJournal(self.journal_file)
+        try:
+            records = journal.replay(self.journal_file)
+            if not records:
+                columns = ['cv_2_id'] + [f'{task}~{label}' for label in labels for task in ('score', 'winner')]
+                partners = next_partners(len(self.df)) if self.pairing == 'next' else None
+                journal.import_progress_csv(self.legacy_progress_file, self.result_journal, columns,
+                                            id_column=self.legacy_id_column, partners=partners)
+                self.label_imported(journal.replay(self.journal_file))
+                records = journal.replay(self.journal_file)
+            journal.apply_records(self.df, records)
+            log.info("Replayed %d results from %s", len(records), self.journal_file)
+
+            self.cv_texts = self.df['Generated_Cover_Letter'].tolist()
+            if self.pairing == 'active':
+                self.run_active(records, labels)
+                return self.finish()
+
+            self.partners = assign_partners(self.df, self.pairing, records, self.result_journal)
+
+            # Queue only the units that the journal doesn't already cover
+            paired_rows = sorted(self.partners)
+            if self.call_mode == 'combined':
+                rows_by_task = {'winner': paired_rows}
+            else:
+                rows_by_task = {'score': range(len(self.df)), 'winner': paired_rows}
+            queue = WorkQueue(plan_units(rows_by_task, labels), records)
+            log.info("Work queue: %s", queue.summary())
+
+            if self.use_batch_api:
+                self.run_batch(queue)
+            else:
+                self.run_live(queue)
+        finally:
+            self.result_journal.close()
+            self.metrics.close()
+
+        return self.finish()
+
+    # Compact the journal into the final wide CSV once, after all rows are processed
+    def finish(self):
+        if self.plan_only:
+            return self.df
+        df = self.df
+
+        # Handle the case where the last row does not have a comparison
+        if self.pairing == 'next':
+            for label in self.providers:
+                df.loc[len(df) - 1, f'winner~{label}'] = 'N/A'
+
+        # Remove the 'ID' column since it's redundant with 'cv_1_id'
+        df = df.drop(columns=['ID'])
+
+        # Reorder columns to have cv_1_id and cv_2_id at the start
+        df = df[['cv_1_id', 'cv_2_id'] + [col for col in df.columns if col not in ['cv_1_id', 'cv_2_id']]]
+
+        write_table(df, self.output_file)
+        log.info("Saved cleaned and modified data to %s", self.output_file)
+        return df
+
+
+# Run one comparison experiment; see ComparisonPipeline for the options
+def run_comparison(providers, output_file, **options):
+    return ComparisonPipeline(providers, output_file, **options).run()
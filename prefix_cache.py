@@ -0,0 +1,145 @@
+import importlib.metadata
+import warnings
+
+# gpt4all releases whose LLModel keeps the prompt context (n_past, tokens_size) in the fields this
+# module rewinds, from the first with special-token prompts up to the switch to Jinja chat templates
+SUPPORTED_VERSIONS = ((2, 2), (3, 5))
+
+# Same fallback the gpt4all bindings use for models without a prompt template
+DEFAULT_PROMPT_TEMPLATE = "### Human:\n{0}\n\n### Assistant:\n"
+
+
+# Reuse of the evaluated prompt prefix for a loaded GPT4All model.
+#
+# GPT4All only keeps one sequence in its KV cache and continues it from `context.n_past`, so instead
+# of a fresh chat session per prompt we feed the prompt line by line, remember n_past after every
+# line and, for the next prompt, rewind to the last line both prompts share. Only the lines after
+# that point (e.g. everything from "CV 2:" onwards when CV 1 repeats) are evaluated again. The parts
+# come in the order chat_session() + generate() uses (system prompt, template head, prompt, template
+# tail, reply), but each line is tokenized on its own, so a token that would span a line break when
+# the whole prompt is tokenized at once is split there instead. Replies can therefore differ from a
+# fresh chat session, which is why the cache is only used with reuse_prefix=True. The rewind
+# writes private fields of the bindings, so the cache is only used on SUPPORTED_VERSIONS and turns
+# itself off (falling back to a chat session per prompt) if those fields turn out to be missing.
+class PrefixCache:
+    def __init__(self, client, system_prompt=None, prompt_template=None, n_batch=128):
+        self.client = client
+        self.llmodel = client.model
+        self.system_prompt = system_prompt if system_prompt is not None else client.config.get('systemPrompt', '')
+        template = prompt_template or client.config.get('promptTemplate') or DEFAULT_PROMPT_TEMPLATE
+        self.head, self.tail = template.format('%1', '%2').split('%1', 1)
+        self.n_batch = n_batch  # Prompt tokens evaluated per batch
+        self.text = ''          # Prompt text whose lines are in the KV cache
+        self.checkpoints = []   # (offset into self.text, n_past, tokens_size) after each evaluated line
+        self.reused = 0         # Characters of prompt text skipped thanks to the cache
+        self.evaluated = 0      # Characters of prompt text evaluated
+        self.enabled = True     # False once the bindings turned out not to allow the rewind
+
+    # True if these bindings are a version we know how to rewind and expose the prompt context
+    @staticmethod
+    def supported(client):
+        try:
+            version = tuple(int(part) for part in importlib.metadata.version('gpt4all').split('.')[:2])
+        except (importlib.metadata.PackageNotFoundError, ValueError):
+            return False
+        if not SUPPORTED_VERSIONS[0] <= version < SUPPORTED_VERSIONS[1]:
+            return False
+        llmodel = getattr(client, 'model', None)
+        return hasattr(llmodel, 'prompt_model') and hasattr(llmodel, 'context')
+
+    def _ingest(self, text, special=False, reset=False):
+        self.llmodel.prompt_model(text, '%1%2', lambda token_id, response: True, n_predict=0,
+                                  n_batch=self.n_batch, reset_context=reset, special=special)
+
+    def _state(self):
+        context = self.llmodel.context
+        return context.n_past, context.tokens_size
+
+    def _rewind(self, n_past, tokens_size):
+        self.llmodel.context.n_past = n_past
+        self.llmodel.context.tokens_size = tokens_size
+
+    # Start over from the system prompt and the template head
+    def _reset(self):
+        self._ingest(self.system_prompt, special=True, reset=True)
+        self._ingest(self.head, special=True)
+        self.text = ''
+        self.checkpoints = [(0, *self._state())]
+
+    # Generate a reply to `prompt` with the same sampling defaults as GPT4All.generate(); generation
+    # ends early once stop(reply so far) is true
+    def generate(self, prompt, temperature=None, max_tokens=200, stop=None):
+        if self.enabled:
+            try:
+                return self._generate_cached(prompt, temperature, max_tokens, stop)
+            except (AttributeError, TypeError) as e:
+                # The bindings don't have the context fields or prompt options the rewind relies on
+                warnings.warn(f"Prefix cache not supported by these gpt4all bindings ({e}); disabled")
+                self.enabled = False
+                self.checkpoints = []
+                self.text = ''
+        return self._generate_plain(prompt, temperature, max_tokens, stop)
+
+    def _generate_cached(self, prompt, temperature, max_tokens, stop):
+        # Lines start at every newline, so each line keeps its leading newline and indentation
+        starts = [0] + [i for i, char in enumerate(prompt) if char == '\n' and i > 0]
+        last_start = starts[-1]
+
+        if not self.checkpoints:
+            self._reset()
+        shared = 0
+        for offset, _, _ in self.checkpoints:
+            if offset <= last_start and offset in starts and prompt[:offset] == self.text[:offset]:
+                shared = offset
+        while self.checkpoints[-1][0] > shared:
+            self.checkpoints.pop()
+        self._rewind(*self.checkpoints[-1][1:])
+        self.text = prompt[:shared]
+        self.reused += shared
+
+        # Evaluate the lines the cache doesn't cover, keeping a checkpoint after each one
+        for start, end in zip(starts, starts[1:]):
+            if start < shared:
+                continue
+            before = self.llmodel.context.n_past
+            self._ingest(prompt[start:end])
+            if self.llmodel.context.n_past <= before:
+                # The context window overflowed and was erased, so none of the checkpoints hold anymore
+                warnings.warn("Prompt no longer fits the context window; prefix cache reset")
+                self.checkpoints = []
+                self.text = ''
+                return self._generate_plain(prompt, temperature, max_tokens, stop)
+            self.text = prompt[:end]
+            self.checkpoints.append((end, *self._state()))
+        self.evaluated += len(prompt) - shared
+
+        reply = []
+        self.llmodel.prompt_model(prompt[last_start:], '%1' + self.tail, _collector(reply, stop),
+                                  n_predict=max_tokens, temp=0.7 if temperature is None else temperature,
+                                  top_k=40, top_p=0.4, min_p=0.0, repeat_penalty=1.18, repeat_last_n=64,
+                                  n_batch=self.n_batch)
+        if self.llmodel.context.n_past <= self.checkpoints[-1][1]:
+            self.checkpoints = []
+            self.text = ''
+        return ''.join(reply)
+
+    def _generate_plain(self, prompt, temperature, max_tokens, stop=None):
+        options = {'max_tokens': max_tokens}
+        if temperature is not None:
+            options['temp'] = temperature
+        if stop is not None:
+            options['callback'] = _collector([], stop)
+        with self.client.chat_session(self.system_prompt):
+            return self.client.generate(prompt, **options)
+
+    # Share of prompt text answered from the cache so far
+    def hit_rate(self):
+        total = self.reused + self.evaluated
+        return self.reused / total if total else 0.0
+
+
+def _collector(parts, stop=None):
+    def callback(token_id, response):
+        parts.append(response)
+        return stop is None or not stop(''.join(parts))
+    return callback
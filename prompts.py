@@ -0,0 +1,52 @@
+# Prompt used to ask for a CV rating (just the cover letter). With json_reply the answer is asked
+# for as a JSON object (see response_format.py) instead of a bare number.
+def rating_prompt(cv_data, json_reply=False):
+    if json_reply:
+        answer = 'Respond with JSON only, in the form {"score": <number>}.'
+    else:
+        answer = "Provide just number, don't provide any text."
+    return f"Rate this CV on a scale of 1 to 100, where 1 is the lowest chance and 100 is the highest chance. {answer}\n\n{cv_data}"
+
+
+# Prompt used to rate several CVs in one request; `letters` is [(CV ID, cover letter)] in the order
+# they are shown
+def batch_rating_prompt(letters, json_reply=False):
+    if json_reply:
+        answer = 'Respond with JSON only, with the ID of every CV as key and its rating as value: {"<ID>": <number>, ...}.'
+    else:
+        answer = "Provide one line per CV in the form 'CV <ID>: <number>', don't provide any other text."
+    cvs = '\n\n'.join(f"CV {cv_id}:\n{letter}" for cv_id, letter in letters)
+    return f"Rate each of these CVs on its own on a scale of 1 to 100, where 1 is the lowest chance and 100 is the highest chance. {answer}\n\n{cvs}"
+
+
+# Prompt used to compare two CVs and ask for the winner only
+def comparison_prompt(cv_data_1, cv_data_2, json_reply=False):
+    if json_reply:
+        answer = 'Respond with JSON only, in the form {"winner": <1 or 2>}.'
+    else:
+        answer = "Provide just number, don't provide a text."
+    return f"Compare these two CVs and choose which one has a better chance of being invited for an interview.\n\nCV 1:\n{cv_data_1}\n\nCV 2:\n{cv_data_2}\n\nReturn 1 for CV 1 and 2 for CV 2. {answer}"
+
+
+# Prompt used by the local models to score both CVs and pick the winner in one answer
+def combined_prompt(cv_data_1, cv_data_2, json_reply=False):
+    if json_reply:
+        answer = """Then, provide a winner: 1 if CV 1 is better, or 2 if CV 2 is better. Respond with JSON only, in this format:
+
+        {"cv1_score": [numeric score], "cv2_score": [numeric score], "winner": [1 or 2]}"""
+    else:
+        answer = """Then, provide a winner: Return '1' if CV 1 is better, or '2' if CV 2 is better. Respond in this format:
+
+        CV 1 Score: [numeric score]
+        CV 2 Score: [numeric score]
+        Winner: [1 or 2]"""
+    return f"""
+        Compare the following two CVs:
+
+        CV 1: {cv_data_1}
+        CV 2: {cv_data_2}
+
+        For each CV, provide a score between 1 and 100, where 1 is the lowest and 100 is the highest chance of being invited for an interview.
+
+        {answer}
+        """
@@ -0,0 +1,221 @@
+import asyncio
+import concurrent.futures
+import multiprocessing
+import os
+import threading
+
+from connections import LatencyLog
+from prefix_cache import PrefixCache
+from response_format import reply_finished
+
+
+# Common interface of every backend: `label` is the score~/winner~ column suffix and
+# complete(prompt, reply_format) returns the raw reply text. A temperature of None keeps the
+# backend's default. With structured_output the prompts ask for a JSON reply and complete() is
+# given the expected response_format.ReplyFormat, which the backend uses to constrain its output;
+# pass structured_output=False for the original plain-text prompts (e.g. to reproduce earlier runs).
+class Provider:
+    name = None
+    default_temperature = None
+
+    def __init__(self, model, label=None, temperature=None, structured_output=True):
+        self.model = model
+        self.label = label or model
+        self.temperature = temperature if temperature is not None else self.default_temperature
+        self.structured_output = structured_output
+        self.latency = LatencyLog()
+
+    # Create the client up front so the first request doesn't pay for it
+    def connect(self):
+        pass
+
+    # Release whatever connect() set up
+    def close(self):
+        pass
+
+    async def complete(self, prompt, reply_format=None):
+        raise NotImplementedError
+
+    # complete() with its connect / time-to-first-byte / total latency recorded in self.latency
+    async def timed_complete(self, prompt, reply_format=None):
+        with self.latency.track():
+            return await self.complete(prompt, reply_format)
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.model!r}, label={self.label!r})"
+
+
+# OpenAI chat completions (openai<1.0 module-level client); run inside connections.pooled_clients
+# so every call goes over the same keep-alive connection pool. Structured replies use JSON mode
+# (gpt-3.5-turbo-1106, gpt-4-turbo, gpt-4o and later), capped at the reply format's max_tokens.
+class OpenAIProvider(Provider):
+    name = 'openai'
+    default_temperature = 0.7
+
+    async def complete(self, prompt, reply_format=None):
+        import openai
+
+        options = {}
+        if reply_format is not None:
+            options = {'response_format': JSON_MODE, 'max_tokens': reply_format.max_tokens}
+        response = await openai.ChatCompletion.acreate(
+            model=self.model,
+            messages=[
+                {"role": "user",
+                 "content": prompt}
+            ],
+            temperature=self.temperature,
+            **options
+        )
+        return response['choices'][0]['message']['content']
+
+
+# response_format of an OpenAI request in JSON mode
+JSON_MODE = {'type': 'json_object'}
+
+
+# Google Gemini through google.generativeai; the GenerativeModel is created once per provider and
+# the library keeps one gRPC (HTTP/2) channel per process underneath it, so calls multiplex over it.
+# Structured replies are constrained by a response schema (gemini-1.5 and later).
+class GeminiProvider(Provider):
+    name = 'gemini'
+
+    def __init__(self, model='gemini-1.5-flash', label=None, temperature=None, structured_output=True):
+        super().__init__(model, label, temperature, structured_output)
+        self.client = None
+
+    def connect(self):
+        import google.generativeai as genai
+
+        if self.client is None:
+            self.client = genai.GenerativeModel(self.model)
+
+    async def complete(self, prompt, reply_format=None):
+        self.connect()
+        generation_config = {}
+        if self.temperature is not None:
+            generation_config['temperature'] = self.temperature
+        if reply_format is not None:
+            generation_config['response_mime_type'] = 'application/json'
+            generation_config['response_schema'] = reply_format.schema
+            generation_config['max_output_tokens'] = reply_format.max_tokens
+        response = await self.client.generate_content_async(prompt, generation_config=generation_config or None)
+        return response.text
+
+
+# CPU cores this process may run on
+def available_cores():
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+# A loaded GPT4All model. With reuse_prefix, prompts go through the prefix cache when the bindings
+# allow it, so the part a prompt shares with the previous one isn't evaluated again.
+class LocalModel:
+    def __init__(self, model, model_path=None, n_threads=None, reuse_prefix=False):
+        from gpt4all import GPT4All
+
+        self.client = GPT4All(model, model_path=model_path, n_threads=n_threads)
+        self.prefix_cache = None
+        if reuse_prefix and PrefixCache.supported(self.client):
+            self.prefix_cache = PrefixCache(self.client)
+
+    # With json_reply, generation stops as soon as the reply holds a complete JSON object
+    def generate(self, prompt, temperature=None, json_reply=False):
+        stop = reply_finished if json_reply else None
+        if self.prefix_cache is not None:
+            return self.prefix_cache.generate(prompt, temperature, stop=stop)
+        options = {} if temperature is None else {'temp': temperature}
+        if stop is not None:
+            options['callback'] = _stop_callback(stop)
+        with self.client.chat_session():
+            return self.client.generate(prompt, **options)
+
+
+# The model held by each GPT4All pool process, loaded once by the pool initializer
+_local_model = None
+
+
+def _load_local_model(model, model_path, n_threads, reuse_prefix):
+    global _local_model
+    _local_model = LocalModel(model, model_path, n_threads, reuse_prefix)
+
+
+def _local_generate(prompt, temperature, json_reply):
+    return _local_model.generate(prompt, temperature, json_reply)
+
+
+# GPT4All token callback that ends generation once stop(reply so far) is true
+def _stop_callback(stop):
+    parts = []
+
+    def callback(token_id, response):
+        parts.append(response)
+        return not stop(''.join(parts))
+    return callback
+
+
+# Local GPT4All model. With one worker it is loaded on first use and run in a thread; with more
+# (AI_BIAS_LOCAL_WORKERS or workers=N) each of N processes loads the model once and gets an equal
+# share of the CPU cores, and prompts are spread across them. Every process holds its own copy of
+# the model in memory. Scripts using more than one worker need an `if __name__ == '__main__'` guard.
+# The bindings take no grammar, so structured replies are asked for in the prompt and generation is
+# cut off at the end of the first JSON object. reuse_prefix=True turns on the prefix cache (see
+# prefix_cache.py); it is off by default because the comparison prompts open with both CVs, so
+# consecutive prompts share little more than their first line, while the cache changes the replies.
+class GPT4AllProvider(Provider):
+    name = 'gpt4all'
+
+    def __init__(self, model, label=None, temperature=None, model_path=None, workers=None, n_threads=None,
+                 reuse_prefix=False, structured_output=True):
+        super().__init__(model, label, temperature, structured_output)
+        self.model_path = model_path
+        self.reuse_prefix = reuse_prefix
+        self.workers = max(1, workers or int(os.environ.get('AI_BIAS_LOCAL_WORKERS', '1')))
+        self.n_threads = n_threads or max(1, available_cores() // self.workers)
+        self.client = None
+        self.pool = None
+        self.lock = threading.Lock()
+
+    def connect(self):
+        if self.workers > 1 and self.pool is None:
+            self.pool = concurrent.futures.ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_load_local_model,
+                initargs=(self.model, self.model_path, self.n_threads, self.reuse_prefix),
+            )
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+    def _generate(self, prompt, json_reply):
+        with self.lock:
+            if self.client is None:
+                self.client = LocalModel(self.model, self.model_path, self.n_threads, self.reuse_prefix)
+            return self.client.generate(prompt, self.temperature, json_reply)
+
+    async def complete(self, prompt, reply_format=None):
+        json_reply = reply_format is not None
+        if self.workers > 1:
+            self.connect()
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.pool, _local_generate, prompt, self.temperature, json_reply)
+        return await asyncio.to_thread(self._generate, prompt, json_reply)
+
+
+PROVIDERS = {
+    'openai': OpenAIProvider,
+    'gemini': GeminiProvider,
+    'gpt4all': GPT4AllProvider,
+}
+
+
+# Build a provider by backend name, e.g. make_provider('gemini', 'gemini-1.5-flash')
+def make_provider(backend, model, **kwargs):
+    if backend not in PROVIDERS:
+        raise ValueError(f"Unknown backend {backend!r}, expected one of {sorted(PROVIDERS)}")
+    return PROVIDERS[backend](model, **kwargs)
@@ -0,0 +1,185 @@
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from scipy.sparse import linalg
+
+from analysis import PROTECTED_ATTRIBUTES, load_results, result_files, result_models, winner_matrix
+from storage import data_path, write_table
+
+
+# Bradley-Terry model: P(i beats j) = p_i / (p_i + p_j), with a latent strength p_i = exp(theta_i)
+# per item (CV).
+#
+# The win counts live in a sparse items x items matrix (wins[i, j] = times i beat j), and the
+# maximum-likelihood log-strengths are found with Newton's method: the Hessian is a weighted graph
+# Laplacian over the compared pairs, so each step is one sparse conjugate-gradient solve and the
+# whole fit costs a few dozen passes over the non-zero pairs however many comparisons there are.
+# Every item also plays `prior` virtual games (half won, half lost) against a reference item with
+# theta = 0: this keeps items that never won or never lost finite, ties disconnected groups of
+# comparisons together and fixes the scale. Comparisons can be added at any time; the next fit
+# starts from the current strengths (new items from their record), so it needs only a few steps.
+class BradleyTerry:
+    def __init__(self, prior=1.0, tol=1e-4, max_iter=100):
+        self.prior = prior
+        self.tol = tol
+        self.max_iter = max_iter
+        self.ids = pd.Index([])
+        self.wins = sparse.csr_matrix((0, 0))
+        self.theta = np.zeros(0)
+        self.iterations = 0
+
+    # Positions of `ids`, registering the ones not seen before
+    def _positions(self, ids):
+        ids = pd.Index(ids)
+        new = ids[self.ids.get_indexer(ids) < 0].unique()
+        if len(new):
+            self.ids = self.ids.append(new) if len(self.ids) else new
+            self.theta = np.concatenate([self.theta, np.zeros(len(new))])
+        return self.ids.get_indexer(ids)
+
+    # Record comparisons: winners[k] beat losers[k]
+    def add(self, winners, losers):
+        known = len(self.ids)
+        winners, losers = self._positions(winners), self._positions(losers)
+        n = len(self.ids)
+
+        # Start new items from their record against the strength of their opponents, so the next
+        # fit starts close to the solution
+        won, lost = np.bincount(winners, minlength=n), np.bincount(losers, minlength=n)
+        opponents = (np.bincount(winners, self.theta[losers], minlength=n)
+                     + np.bincount(losers, self.theta[winners], minlength=n)) / np.maximum(won + lost, 1)
+        start = opponents + np.log((won + self.prior / 2) / (lost + self.prior / 2))
+        self.theta[known:] = start[known:]
+
+        self.wins.resize((n, n))
+        self.wins = (self.wins + sparse.csr_matrix((np.ones(len(winners)), (winners, losers)), shape=(n, n))).tocsr()
+        return self
+
+    def comparisons(self):
+        return int(self.wins.sum())
+
+    def _log_likelihood(self, theta, pairs):
+        row, col, count = pairs
+        return (-(count * np.logaddexp(0, theta[col] - theta[row])).sum()
+                - self.prior / 2 * (np.logaddexp(0, theta) + np.logaddexp(0, -theta)).sum())
+
+    # Per-pair weights and diagonal of the negative Hessian of the log-likelihood, which is the
+    # Laplacian of the comparison graph with these weights plus the prior on the diagonal
+    def _curvature(self, theta, pairs):
+        row, col, count = pairs
+        n = len(theta)
+        won = _sigmoid(theta[row] - theta[col])
+        weight = count * won * (1 - won)
+        prior = _sigmoid(theta)
+        diagonal = (np.bincount(row, weight, minlength=n) + np.bincount(col, weight, minlength=n)
+                    + self.prior * prior * (1 - prior))
+        return weight, diagonal
+
+    # Maximum-likelihood strengths for all comparisons so far
+    def fit(self):
+        wins = self.wins.tocoo()
+        row, col = wins.row, wins.col
+        pairs = (row, col, wins.data)
+        n = len(self.theta)
+
+        # Both directions of every compared pair, grouped by row: the Hessian's sparsity pattern,
+        # built once per fit so each step only fills in new weights
+        ends, others = np.concatenate([row, col]), np.concatenate([col, row])
+        order = np.argsort(ends, kind='stable')
+        indices = others[order]
+        indptr = np.concatenate([[0], np.cumsum(np.bincount(ends, minlength=n))])
+
+        theta = self.theta
+        likelihood = self._log_likelihood(theta, pairs)
+        for self.iterations in range(1, self.max_iter + 1):
+            lost = wins.data * _sigmoid(theta[col] - theta[row])
+            gradient = (np.bincount(row, lost, minlength=n) - np.bincount(col, lost, minlength=n)
+                        + self.prior / 2 * (1 - 2 * _sigmoid(theta)))
+            weight, diagonal = self._curvature(theta, pairs)
+            laplacian = sparse.csr_matrix((-np.concatenate([weight, weight])[order], indices, indptr), shape=(n, n))
+            information = linalg.LinearOperator((n, n), matvec=lambda v: laplacian @ v + diagonal * v, dtype=float)
+            step, _ = linalg.cg(information, gradient, rtol=1e-6, M=sparse.diags(1 / diagonal))
+
+            # Halve the step until the likelihood improves (only the first steps from far away need it)
+            for _ in range(30):
+                updated = theta + step
+                updated_likelihood = self._log_likelihood(updated, pairs)
+                if updated_likelihood >= likelihood - 1e-9 * abs(likelihood):
+                    break
+                step = step / 2
+            theta, likelihood = updated, updated_likelihood
+            if np.abs(step).max(initial=0) < self.tol:
+                break
+        self.theta = theta
+        return self
+
+    # Log-strengths per item id (0 is the reference; differences are log-odds of winning)
+    def scores(self):
+        return pd.Series(self.theta, index=self.ids)
+
+    # Approximate standard errors of the log-strengths, from the diagonal of the Fisher information
+    def standard_errors(self):
+        wins = self.wins.tocoo()
+        _, diagonal = self._curvature(self.theta, (wins.row, wins.col, wins.data))
+        return pd.Series(1 / np.sqrt(diagonal), index=self.ids)
+
+    # Probability that each of items_a beats the matching item of items_b
+    def win_probability(self, items_a, items_b):
+        return _sigmoid(self.theta[self.ids.get_indexer(items_a)] - self.theta[self.ids.get_indexer(items_b)])
+
+
+def _sigmoid(x):
+    return 0.5 * (1 + np.tanh(x / 2))
+
+
+# (winner ids, loser ids) of a model's decided comparisons in an output
+def comparisons(df, model):
+    winners = winner_matrix(df, [model])[:, 0]
+    decided = ~np.isnan(winners) & df['cv_2_id'].notna().to_numpy()
+    first = pd.to_numeric(df['cv_1_id'], errors='coerce').to_numpy()[decided]
+    second = pd.to_numeric(df['cv_2_id'], errors='coerce').to_numpy()[decided]
+    first_won = winners[decided] == 1
+    return np.where(first_won, first, second), np.where(first_won, second, first)
+
+
+# Mean latent strength per protected attribute value, relative to the mean over all CVs
+def strength_deltas(df, scores):
+    rows = df.set_index(pd.to_numeric(df['cv_1_id'], errors='coerce'))
+    rows = rows[rows.index.isin(scores.index)]
+    long = rows[PROTECTED_ATTRIBUTES].melt(var_name='attribute', value_name='value', ignore_index=False)
+    long['strength'] = scores.reindex(long.index).to_numpy()
+    table = long.groupby(['attribute', 'value']).agg(n=('strength', 'size'), mean_strength=('strength', 'mean'))
+    table['delta'] = table['mean_strength'] - scores.reindex(rows.index).mean()
+    return table.reset_index()
+
+
+if __name__ == '__main__':
+    paths = sys.argv[1:] or result_files()
+    strengths, deltas = [], []
+    for path in paths:
+        df = load_results(path)
+        source = os.path.basename(os.path.splitext(path)[0])
+        for model in result_models(df):
+            winners, losers = comparisons(df, model)
+            if not len(winners):
+                continue
+            start = time.perf_counter()
+            solver = BradleyTerry().add(winners, losers).fit()
+            print(f"{source} {model}: {len(winners)} comparisons, {len(solver.ids)} CVs, "
+                  f"{solver.iterations} iterations in {time.perf_counter() - start:.3f}s")
+
+            table = pd.DataFrame({'cv_id': solver.ids, 'strength': solver.scores().to_numpy(),
+                                  'standard_error': solver.standard_errors().to_numpy()})
+            for frames, frame in ((strengths, table), (deltas, strength_deltas(df, solver.scores()))):
+                frame.insert(0, 'model', model)
+                frame.insert(0, 'file', source)
+                frames.append(frame)
+
+    for name, frames in (('strengths', strengths), ('strength_deltas', deltas)):
+        output_file = data_path(f'bias_ranking_{name}.csv')
+        write_table(pd.concat(frames, ignore_index=True), output_file)
+        print(f"Saved {output_file}")
@@ -0,0 +1,184 @@
+import asyncio
+import random
+import re
+import time
+from collections import deque
+
+
+# Token bucket that refills continuously at a fixed rate per minute
+class TokenBucket:
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate = rate_per_minute / 60.0  # Tokens added per second
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    # Change the refill rate (tokens already in the bucket are kept up to the new capacity)
+    def set_rate(self, rate_per_minute):
+        self._refill()
+        self.rate = rate_per_minute / 60.0
+
+    # Hand out nothing until `seconds` from now, e.g. when the server asked us to retry later
+    def pause(self, seconds):
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+        self.tokens = min(self.tokens, 0)
+
+    # Wait until `amount` tokens are available and take them
+    async def acquire(self, amount=1):
+        # A single request larger than the bucket can never fit, so cap it at the capacity
+        amount = min(amount, self.capacity)
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                if now < self.blocked_until:
+                    await asyncio.sleep(self.blocked_until - now)
+                    continue
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+
+
+# Requests-per-minute and tokens-per-minute budget for a single model
+class RateBudget:
+    def __init__(self, rpm, tpm):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+
+    # Wait until one request carrying `tokens` tokens fits into both budgets
+    async def acquire(self, tokens):
+        await self.requests.acquire(1)
+        await self.tokens.acquire(tokens)
+
+    # Plain budgets ignore server feedback
+    def on_success(self):
+        pass
+
+    def on_throttled(self, retry_after=None):
+        pass
+
+    def utilization(self):
+        return ''
+
+
+# Budget that starts at the configured quota and adapts to what the server actually allows:
+# a 429 / ResourceExhausted cuts the allowed rate (and honours any retry-after hint), each success
+# wins a little of it back (additive increase, multiplicative decrease). The 429s of one overload
+# arrive in a burst from every request in flight, so the rate is cut at most once per
+# `cut_interval` seconds; the rest of the burst is only counted.
+class AdaptiveRateBudget(RateBudget):
+    def __init__(self, rpm, tpm, decrease=0.7, min_fraction=0.05, recover_per_success=0.01, cut_interval=1.0):
+        super().__init__(rpm, tpm)
+        self.decrease = decrease
+        self.min_fraction = min_fraction
+        self.recover_per_success = recover_per_success
+        self.cut_interval = cut_interval
+        self.last_cut = None
+        self.fraction = 1.0  # Share of the configured quota currently allowed
+        self.sent = deque()  # Send times over the last minute, for the utilization report
+        self.sent_tokens = deque()
+        self.throttled = 0
+
+    def _apply_fraction(self):
+        self.requests.set_rate(self.rpm * self.fraction)
+        self.tokens.set_rate(self.tpm * self.fraction)
+
+    async def acquire(self, tokens):
+        await super().acquire(tokens)
+        now = time.monotonic()
+        self.sent.append(now)
+        self.sent_tokens.append((now, tokens))
+
+    def on_success(self):
+        if self.fraction < 1.0:
+            self.fraction = min(1.0, self.fraction + self.recover_per_success)
+            self._apply_fraction()
+
+    def on_throttled(self, retry_after=None):
+        self.throttled += 1
+        now = time.monotonic()
+        if self.last_cut is None or now - self.last_cut >= self.cut_interval:
+            self.last_cut = now
+            self.fraction = max(self.min_fraction, self.fraction * self.decrease)
+            self._apply_fraction()
+        if retry_after:
+            self.requests.pause(retry_after)
+
+    # One-line summary of the last minute, e.g. '412/500 rpm (82% of quota), allowed 100%, 3 throttled'
+    def utilization(self):
+        cutoff = time.monotonic() - 60
+        while self.sent and self.sent[0] < cutoff:
+            self.sent.popleft()
+        while self.sent_tokens and self.sent_tokens[0][0] < cutoff:
+            self.sent_tokens.popleft()
+        used_tokens = sum(tokens for _, tokens in self.sent_tokens)
+        return (f"{len(self.sent)}/{self.rpm} rpm ({len(self.sent) / self.rpm:.0%} of quota), "
+                f"{used_tokens}/{self.tpm} tpm, allowed {self.fraction:.0%}, {self.throttled} throttled")
+
+
+# True for 429 / quota errors from the OpenAI and Gemini clients (or anything carrying an HTTP 429)
+def is_rate_limit_error(exc):
+    if type(exc).__name__ in ('RateLimitError', 'ResourceExhausted', 'TooManyRequests'):
+        return True
+    return _status_code(exc) == 429
+
+
+# True for errors worth retrying without slowing down: server-side failures and timeouts
+def is_transient_error(exc):
+    if isinstance(exc, (asyncio.TimeoutError, ConnectionError)):
+        return True
+    if type(exc).__name__ in ('Timeout', 'APIConnectionError', 'ServiceUnavailableError', 'ServiceUnavailable',
+                              'DeadlineExceeded', 'InternalServerError'):
+        return True
+    status = _status_code(exc)
+    return status is not None and status >= 500
+
+
+def _status_code(exc):
+    for attr in ('http_status', 'status_code', 'code'):
+        value = getattr(exc, attr, None)
+        if isinstance(value, int):
+            return value
+    return None
+
+
+# Seconds the server asked us to wait, from Retry-After headers, Gemini RetryInfo or the message text
+def retry_after(exc):
+    headers = getattr(exc, 'headers', None) or {}
+    for name in ('retry-after', 'Retry-After', 'x-ratelimit-reset-requests'):
+        value = headers.get(name) if hasattr(headers, 'get') else None
+        seconds = _parse_seconds(value)
+        if seconds is not None:
+            return seconds
+    for detail in getattr(exc, 'details', None) or []:
+        delay = getattr(detail, 'retry_delay', None)
+        if delay is not None:
+            return delay.seconds + delay.nanos / 1e9
+    match = re.search(r"retry (?:in|after) ([\d.]+)\s*(ms|s)", str(exc), re.IGNORECASE)
+    if match:
+        return float(match.group(1)) / (1000 if match.group(2).lower() == 'ms' else 1)
+    return None
+
+
+def _parse_seconds(value):
+    if value is None:
+        return None
+    match = re.fullmatch(r"\s*([\d.]+)\s*(ms|s)?\s*", str(value))
+    if not match:
+        return None
+    return float(match.group(1)) / (1000 if match.group(2) == 'ms' else 1)
+
+
+# Exponential backoff with full jitter: a random delay in [0, min(cap, base * 2 ** attempt)]
+def backoff_delay(attempt, base=1.0, cap=60.0):
+    return random.uniform(0, min(cap, base * 2 ** attempt))
@@ -0,0 +1,97 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+
+# Default cache location and size; override with AI_BIAS_CACHE_FILE / AI_BIAS_CACHE_MB
+DEFAULT_CACHE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'llm_response_cache.sqlite')
+DEFAULT_MAX_MB = 512
+
+
+# Hash of everything that determines a response: provider, model, prompt text and sampling parameters
+def cache_key(provider, model, prompt, temperature=None, seed=None):
+    payload = json.dumps([provider, model, prompt, temperature, seed], ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+# Persistent on-disk cache of raw LLM response texts with size-bounded LRU eviction.
+# Set AI_BIAS_NO_CACHE=1 (or pass enabled=False) to bypass it for deliberate resampling.
+class ResponseCache:
+    def __init__(self, path=None, max_mb=None, enabled=None):
+        self.path = path or os.environ.get('AI_BIAS_CACHE_FILE', DEFAULT_CACHE_FILE)
+        self.max_bytes = int(float(max_mb or os.environ.get('AI_BIAS_CACHE_MB', DEFAULT_MAX_MB)) * 1024 * 1024)
+        if enabled is None:
+            enabled = os.environ.get('AI_BIAS_NO_CACHE', '') not in ('1', 'true', 'yes')
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self.db = None
+        if self.enabled:
+            self.db = sqlite3.connect(self.path, timeout=30)
+            self.db.execute('PRAGMA journal_mode=WAL')
+            self.db.execute('PRAGMA synchronous=NORMAL')
+            self.db.execute('CREATE TABLE IF NOT EXISTS responses ('
+                            'key TEXT PRIMARY KEY, response TEXT NOT NULL, '
+                            'size INTEGER NOT NULL, last_used REAL NOT NULL)')
+            self.db.execute('CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)')
+            self.db.commit()
+            self.size = self.db.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+
+    def get(self, provider, model, prompt, temperature=None, seed=None):
+        if not self.enabled:
+            return None
+        key = cache_key(provider, model, prompt, temperature, seed)
+        row = self.db.execute('SELECT response FROM responses WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.db.execute('UPDATE responses SET last_used = ? WHERE key = ?', (time.time(), key))
+        self.db.commit()
+        return row[0]
+
+    def put(self, provider, model, prompt, response, temperature=None, seed=None):
+        if not self.enabled:
+            return
+        key = cache_key(provider, model, prompt, temperature, seed)
+        size = len(key) + len(response.encode('utf-8'))
+        old = self.db.execute('SELECT size FROM responses WHERE key = ?', (key,)).fetchone()
+        self.db.execute('INSERT OR REPLACE INTO responses (key, response, size, last_used) VALUES (?, ?, ?, ?)',
+                        (key, response, size, time.time()))
+        self.size += size - (old[0] if old else 0)
+        if self.size > self.max_bytes:
+            self._evict()
+        self.db.commit()
+
+    # Drop least recently used entries until the cache is back under 90% of its size limit
+    def _evict(self):
+        target = self.max_bytes * 0.9
+        for key, size in self.db.execute('SELECT key, size FROM responses ORDER BY last_used').fetchall():
+            if self.size <= target:
+                break
+            self.db.execute('DELETE FROM responses WHERE key = ?', (key,))
+            self.size -= size
+
+    # Return the cached response for this request, or call `fetch()` and cache what it returns;
+    # refresh=True always fetches (e.g. to replace a reply that couldn't be parsed)
+    def call(self, provider, model, prompt, fetch, temperature=None, seed=None, refresh=False):
+        response = None if refresh else self.get(provider, model, prompt, temperature, seed)
+        if response is None:
+            response = fetch()
+            self.put(provider, model, prompt, response, temperature, seed)
+        return response
+
+    # Async version of call() for coroutine fetchers
+    async def acall(self, provider, model, prompt, fetch, temperature=None, seed=None, refresh=False):
+        response = None if refresh else self.get(provider, model, prompt, temperature, seed)
+        if response is None:
+            response = await fetch()
+            self.put(provider, model, prompt, response, temperature, seed)
+        return response
+
+    def close(self):
+        if self.db is not None:
+            self.db.close()
+            self.db = None
@@ -0,0 +1,143 @@
+import json
+import re
+
+# A reply is a single flat JSON object; every one in the text is tried in turn and the first valid one
+# is taken, so a model that wraps it in a code fence or adds a sentence (even one with braces) around
+# it still parses
+_JSON_OBJECT = re.compile(r'\{[^{}]*\}')
+
+# Plain-text replies (providers without structured output): the reply must be the answer alone,
+# e.g. "85", "85/100" or "CV 2", so a CV number or a year inside a sentence is never taken as one
+_TEXT_SCORE = re.compile(r'[\s*"]*(\d{1,3})\s*(?:/\s*100)?[\s.*"]*')
+_TEXT_WINNER = re.compile(r'[\s*"]*(?:CV\s*)?([12])[\s.*"]*', re.IGNORECASE)
+_TEXT_BATCH_SCORE = re.compile(r'CV\s*(\d+)\s*[:=-]\s*\**\s*(\d{1,3})\b', re.IGNORECASE)
+_TEXT_LABELS = {
+    'cv1_score': re.compile(r'CV 1 Score:\s*\**\s*(\d+)'),
+    'cv2_score': re.compile(r'CV 2 Score:\s*\**\s*(\d+)'),
+    'winner': re.compile(r'Winner:\s*\**\s*(?:CV\s*)?(\d+)'),
+}
+
+SCORES = range(1, 101)
+WINNERS = (1, 2)
+
+
+# Reply of one prompt type: the fields a reply must have with the values allowed for each and the
+# result column (task) each one is recorded in (None for fields that are only validated).
+# `schema` is the JSON schema handed to backends that constrain their output to one.
+class ReplyFormat:
+    def __init__(self, name, fields, text_parser, max_tokens):
+        self.name = name
+        self.fields = fields
+        self.text_parser = text_parser
+        self.max_tokens = max_tokens  # Output cap of a structured request, and its allowance in the token budget
+        self.schema = {
+            'type': 'object',
+            'properties': {field: {'type': 'integer'} for field in fields},
+            'required': list(fields),
+        }
+
+    # {task: value} for a valid reply, {} for anything else
+    def parse(self, text):
+        for values in _json_objects(text):
+            results = self.validate(values)
+            if results:
+                return results
+        values = self.text_parser(text)
+        return self.validate(values) if isinstance(values, dict) else {}
+
+    # {task: value} if `values` has every field with an allowed value, else {}
+    def validate(self, values):
+        results = {}
+        for field, (task, allowed) in self.fields.items():
+            value = _integer(values.get(field))
+            if value not in allowed:
+                return {}
+            if task is not None:
+                results[task] = value
+        return results
+
+
+# Every flat JSON object in `text` that parses, in order
+def _json_objects(text):
+    for match in _JSON_OBJECT.finditer(text):
+        try:
+            values = json.loads(match.group(0))
+        except ValueError:
+            continue
+        if isinstance(values, dict):
+            yield values
+
+
+def _integer(value):
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return value
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, str) and value.strip().isdigit():
+        return int(value)
+    return None
+
+
+def _first_line(text):
+    lines = text.strip().splitlines()
+    return lines[0] if lines else ''
+
+
+def _text_score(text):
+    match = _TEXT_SCORE.fullmatch(text)
+    return {'score': int(match.group(1))} if match else None
+
+
+def _text_winner(text):
+    match = _TEXT_WINNER.fullmatch(_first_line(text))
+    return {'winner': int(match.group(1))} if match else None
+
+
+def _text_combined(text):
+    values = {}
+    for field, pattern in _TEXT_LABELS.items():
+        match = pattern.search(text)
+        if match is None:
+            return None
+        values[field] = int(match.group(1))
+    return values
+
+
+SCORE = ReplyFormat('score', {'score': ('score', SCORES)}, _text_score, max_tokens=16)
+WINNER = ReplyFormat('winner', {'winner': ('winner', WINNERS)}, _text_winner, max_tokens=16)
+COMBINED = ReplyFormat('combined', {'cv1_score': ('score', SCORES), 'cv2_score': ('partner_score', SCORES),
+                                    'winner': ('winner', WINNERS)}, _text_combined, max_tokens=48)
+
+
+# Reply to a batched rating prompt: one score per CV ID, e.g. {"12": 85, "40": 70}. Unlike a
+# ReplyFormat it keeps every valid score, so only the CVs left without one are asked again.
+class ScoreBatchFormat:
+    def __init__(self, ids):
+        self.ids = list(ids)
+        keys = [str(cv_id) for cv_id in self.ids]
+        self.max_tokens = 8 * len(keys) + 16
+        self.schema = {'type': 'object', 'properties': {key: {'type': 'integer'} for key in keys}, 'required': keys}
+
+    # {CV ID: score} for the IDs with a valid score in the reply (from the first JSON object holding any)
+    def parse(self, text):
+        for values in _json_objects(text):
+            scores = self.validate(values)
+            if scores:
+                return scores
+        return self.validate(dict(_TEXT_BATCH_SCORE.findall(text)))
+
+    def validate(self, values):
+        scores = {}
+        for cv_id in self.ids:
+            value = _integer(values.get(str(cv_id)))
+            if value in SCORES:
+                scores[cv_id] = value
+        return scores
+
+
+# True once `text` holds a complete JSON object, so local generation can stop right there (braces in
+# a sentence before it don't count)
+def reply_finished(text):
+    return '}' in text and next(_json_objects(text), None) is not None
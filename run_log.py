@@ -0,0 +1,54 @@
+import logging
+import os
+import sys
+import time
+
+# Level of the scripts' log output; set AI_BIAS_LOG_LEVEL=DEBUG to also see a line per finished
+# request, or WARNING to keep only problems
+DEFAULT_LEVEL = 'INFO'
+
+
+# Logger of one module under the shared 'ai_bias' logger, which writes timestamped lines to stdout
+def get_logger(name):
+    root = logging.getLogger('ai_bias')
+    if not root.handlers:
+        handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(message)s', '%H:%M:%S'))
+        root.addHandler(handler)
+        root.setLevel(os.environ.get('AI_BIAS_LOG_LEVEL', DEFAULT_LEVEL).upper())
+        root.propagate = False
+    return logging.getLogger(f'ai_bias.{name}')
+
+
+# Logger for messages that repeat in the hot path (progress, per-request errors): each message lets
+# at most one line through per `interval` seconds, and with `note_skipped` the next line that gets
+# through says how many were skipped. Disabled levels return before any formatting.
+class RateLimitedLogger:
+    def __init__(self, logger, interval=10, note_skipped=True):
+        self.logger = logger
+        self.interval = interval
+        self.note_skipped = note_skipped
+        self.last = {}  # (level, message template): (time of the last line, lines skipped since)
+
+    def log(self, level, msg, *args, force=False):
+        if not self.logger.isEnabledFor(level):
+            return
+        key = (level, msg)
+        now = time.monotonic()
+        last, skipped = self.last.get(key, (None, 0))
+        if not force and last is not None and now - last < self.interval:
+            self.last[key] = (last, skipped + 1)
+            return
+        if skipped and self.note_skipped:
+            msg, args = msg + ' (%d similar lines skipped)', args + (skipped,)
+        self.logger.log(level, msg, *args)
+        self.last[key] = (now, 0)
+
+    def debug(self, msg, *args, force=False):
+        self.log(logging.DEBUG, msg, *args, force=force)
+
+    def info(self, msg, *args, force=False):
+        self.log(logging.INFO, msg, *args, force=force)
+
+    def warning(self, msg, *args, force=False):
+        self.log(logging.WARNING, msg, *args, force=force)
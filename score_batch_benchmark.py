@@ -0,0 +1,91 @@
+import argparse
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+from analysis import load_results, result_models, score_matrix
+from storage import data_path, write_table
+
+
+# Batched scores next to the single-CV scores of the same CVs: (models, batched scores, baseline
+# scores, positions, batch sizes), each matrix n x models over the batched output's rows
+def align(baseline, batched):
+    models = [model for model in result_models(batched) if f'score_position~{model}' in batched]
+    ids = pd.to_numeric(batched['cv_1_id'], errors='coerce')
+    rows = pd.Index(pd.to_numeric(baseline['cv_1_id'], errors='coerce')).get_indexer(ids)
+    reference = np.full((len(batched), len(models)), np.nan)
+    found = rows >= 0
+    reference[found] = score_matrix(baseline, models)[rows[found]]
+
+    positions = np.full((len(batched), len(models)), np.nan)
+    sizes = np.full((len(batched), len(models)), np.nan)
+    for j, model in enumerate(models):
+        positions[:, j] = pd.to_numeric(batched[f'score_position~{model}'], errors='coerce')
+        sizes[:, j] = pd.to_numeric(batched[f'score_batch~{model}'], errors='coerce')
+    return models, score_matrix(batched, models), reference, positions, sizes
+
+
+# One row per model: how closely the batched scores follow the single-CV ones, how many requests
+# they took, and whether the position of a letter in its batch moves its score (the slope of the
+# score difference over the position, and a one-way ANOVA of the batched scores across positions,
+# which is unbiased because positions are shuffled)
+def summary(models, scores, reference, positions, sizes):
+    table = []
+    for j, model in enumerate(models):
+        batched = ~np.isnan(scores[:, j]) & ~np.isnan(positions[:, j])
+        both = batched & ~np.isnan(reference[:, j])
+        delta = scores[both, j] - reference[both, j]
+        enough = both.sum() > 2
+        slope = stats.linregress(positions[both, j], delta) if enough and np.ptp(positions[both, j]) > 0 else None
+        groups = [scores[batched & (positions[:, j] == p), j] for p in np.unique(positions[batched, j])]
+        groups = [group for group in groups if len(group) > 1]
+        anova = stats.f_oneway(*groups) if len(groups) > 1 else None
+        table.append({
+            'model': model,
+            'scored': int(batched.sum()),
+            'requests': int(round((1 / sizes[batched, j]).sum())),
+            'mean_batch_size': sizes[batched, j].mean() if batched.any() else np.nan,
+            'compared': int(both.sum()),
+            'pearson': stats.pearsonr(scores[both, j], reference[both, j])[0] if enough else np.nan,
+            'spearman': stats.spearmanr(scores[both, j], reference[both, j])[0] if enough else np.nan,
+            'mean_delta': delta.mean() if both.any() else np.nan,
+            'mean_abs_delta': np.abs(delta).mean() if both.any() else np.nan,
+            'position_slope': slope.slope if slope else np.nan,
+            'position_slope_p': slope.pvalue if slope else np.nan,
+            'position_anova_p': anova.pvalue if anova else np.nan,
+        })
+    return pd.DataFrame(table)
+
+
+# Mean batched score, and mean difference from the single-CV score, per model and position in the batch
+def position_effects(models, scores, reference, positions):
+    frames = []
+    for j, model in enumerate(models):
+        batched = ~np.isnan(scores[:, j]) & ~np.isnan(positions[:, j])
+        frame = pd.DataFrame({'position': positions[batched, j].astype(int), 'score': scores[batched, j],
+                              'delta': scores[batched, j] - reference[batched, j]})
+        table = frame.groupby('position').agg(n=('score', 'size'), mean_score=('score', 'mean'),
+                                              mean_delta=('delta', 'mean')).reset_index()
+        table.insert(0, 'model', model)
+        frames.append(table)
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compare batched CV scores with single-CV scores")
+    parser.add_argument('baseline', nargs='?', default=data_path('synthetic_data_large_final_gpt.csv'))
+    parser.add_argument('batched', nargs='?', default=data_path('synthetic_data_large_final_gpt_score_batch.csv'))
+    args = parser.parse_args()
+
+    aligned = align(load_results(args.baseline), load_results(args.batched))
+    results = summary(*aligned)
+    positions = position_effects(*aligned[:4])
+    with pd.option_context('display.width', 200, 'display.max_columns', 20):
+        print(results.round(3).to_string(index=False))
+        print(positions.round(2).to_string(index=False))
+
+    for name, table in (('summary', results), ('positions', positions)):
+        output_file = data_path(f'score_batch_benchmark_{name}.csv')
+        write_table(table, output_file)
+        print(f"Saved {output_file}")
@@ -0,0 +1,136 @@
+import asyncio
+from collections import defaultdict
+
+from rate_limit import AdaptiveRateBudget, backoff_delay, is_rate_limit_error, is_transient_error, retry_after
+from run_log import RateLimitedLogger, get_logger
+
+log = get_logger('scoring_engine')
+
+
+# A single unit of work: one rating or comparison request for one row and one model. The tokens it
+# charges to the tokens-per-minute budget are its prompt tokens (counted with token_budget.TokenCounter,
+# or roughly estimated from the length) plus the most tokens its reply may use.
+class Job:
+    def __init__(self, index, model, task, prompt, call, input_tokens=None, output_tokens=16):
+        self.index = index      # Row index in the DataFrame
+        self.model = model      # Model name used for the score~/winner~ column suffix
+        self.task = task        # 'score' or 'winner'
+        self.prompt = prompt    # Prompt text
+        self.call = call        # Coroutine function that performs the request and returns the parsed result
+        self.input_tokens = input_tokens if input_tokens is not None else len(prompt) // 4
+        self.output_tokens = output_tokens
+
+    @property
+    def tokens(self):
+        return self.input_tokens + self.output_tokens
+
+
+# Asyncio engine that runs many jobs at once while keeping each model inside its own rate budget.
+# Retries, throttling and failures are counted per model in `metrics` (a metrics.RunMetrics), whose
+# files are rewritten with every utilization report.
+class ScoringEngine:
+    def __init__(self, budgets, concurrency=16, max_retries=6, report_interval=60, metrics=None):
+        self.budgets = budgets                  # Dict of model -> RateBudget
+        self.concurrency = concurrency          # Number of in-flight requests per model
+        self.max_retries = max_retries          # Retries per job after a 429 or a transient server error
+        self.report_interval = report_interval  # Seconds between utilization lines in the log
+        self.metrics = metrics
+        self.errors = RateLimitedLogger(log)
+        self.completed = 0
+        self.failed = 0
+        self.retries = 0
+
+    # Send one job, backing off and retrying when the server throttles us or fails transiently
+    async def _attempt(self, job, budget):
+        attempt = 0
+        while True:
+            if budget is not None:
+                await budget.acquire(job.tokens)
+            try:
+                result = await job.call()
+            except Exception as e:
+                throttled = is_rate_limit_error(e)
+                if attempt >= self.max_retries or not (throttled or is_transient_error(e)):
+                    raise
+                delay = backoff_delay(attempt)
+                if throttled:
+                    wait = retry_after(e)
+                    if budget is not None:
+                        # The budget now holds every worker of this model until the retry-after hint passes
+                        budget.on_throttled(wait)
+                    elif wait:
+                        delay = max(delay, wait)
+                attempt += 1
+                self.retries += 1
+                if self.metrics is not None:
+                    self.metrics.count(job.model, 'retries')
+                    if throttled:
+                        self.metrics.count(job.model, 'throttled')
+                await asyncio.sleep(delay)
+            else:
+                if budget is not None:
+                    budget.on_success()
+                return result
+
+    async def _worker(self, model, queue, on_result, on_error):
+        budget = self.budgets.get(model)
+        while True:
+            job = await queue.get()
+            try:
+                result = await self._attempt(job, budget)
+            except Exception as e:
+                self.failed += 1
+                if self.metrics is not None:
+                    self.metrics.count(job.model, 'failed')
+                on_error(job, e)
+            else:
+                self.completed += 1
+                on_result(job, result)
+            finally:
+                queue.task_done()
+
+    # Log each model's share of its quota and update the metrics files at a steady interval while jobs are running
+    async def _report(self):
+        while True:
+            await asyncio.sleep(self.report_interval)
+            for model, budget in self.budgets.items():
+                log.info("[%s] %s", model, budget.utilization())
+            log.info("%d done, %d failed, %d retried", self.completed, self.failed, self.retries)
+            if self.metrics is not None:
+                self.metrics.write()
+
+    # Run all jobs; each model gets its own queue and workers so a slow or throttled model never blocks the others
+    async def run(self, jobs, on_result, on_error=None):
+        if on_error is None:
+            on_error = lambda job, e: self.errors.warning("Error in %s for row %d with %s: %s",
+                                                          job.task, job.index + 1, job.model, e)
+
+        queues = defaultdict(asyncio.Queue)
+        for job in jobs:
+            queues[job.model].put_nowait(job)
+
+        workers = []
+        for model, queue in queues.items():
+            for _ in range(min(self.concurrency, queue.qsize())):
+                workers.append(asyncio.create_task(self._worker(model, queue, on_result, on_error)))
+
+        if (self.budgets or self.metrics is not None) and self.report_interval:
+            workers.append(asyncio.create_task(self._report()))
+
+        # Workers only ever exit by raising (e.g. from a result callback), so stop as soon as
+        # either every queue is drained or a worker has crashed, rather than waiting forever
+        drained = asyncio.ensure_future(asyncio.gather(*(queue.join() for queue in queues.values())))
+        done, _ = await asyncio.wait([drained, *workers], return_when=asyncio.FIRST_COMPLETED)
+        drained.cancel()
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(drained, *workers, return_exceptions=True)
+        for task in done:
+            if task is not drained:
+                task.result()
+
+
+# Build a budget table from {model: (requests per minute, tokens per minute)}; the budgets start at
+# the configured quota and back off on their own when the API answers with 429s
+def make_budgets(limits):
+    return {model: AdaptiveRateBudget(rpm, tpm) for model, (rpm, tpm) in limits.items()}
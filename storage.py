@@ -0,0 +1,163 @@
+import os
+import shutil
+import sys
+
+import pandas as pd
+
+# Long free-text columns, stored as Arrow large strings rather than dictionary-encoded
+TEXT_COLUMNS = ('Generated_Cover_Letter',)
+
+# An object column is stored as a category (dictionary-encoded, read back as pandas categorical)
+# when it has at most this many distinct values and they repeat at least twice on average
+MAX_CATEGORIES = 10000
+
+
+# The format follows the file extension: .parquet is Parquet, anything else is CSV
+def is_parquet(path):
+    return str(path).endswith('.parquet')
+
+
+# Path of a dataset in the configured format: with AI_BIAS_FORMAT=parquet every script reads and
+# writes `name.parquet` wherever it used to use `name.csv`
+def data_path(path):
+    if os.environ.get('AI_BIAS_FORMAT', 'csv') == 'parquet' and str(path).endswith('.csv'):
+        return str(path)[:-len('.csv')] + '.parquet'
+    return path
+
+
+# Object columns that Parquet should store as categories
+def categorical_columns(df):
+    columns = []
+    for column in df.columns[df.dtypes == object]:
+        if column in TEXT_COLUMNS:
+            continue
+        distinct = df[column].nunique()
+        if distinct <= MAX_CATEGORIES and distinct * 2 <= len(df):
+            columns.append(column)
+    return columns
+
+
+# Arrow table for a DataFrame: mixed object columns (e.g. ages with the "NONE" sentinel) become
+# strings, which is also what reading the CSV back gives, and the chosen columns become categories
+def _to_arrow(df, categorical):
+    import pyarrow as pa
+
+    df = df.copy()
+    for column in df.columns[df.dtypes == object]:
+        df[column] = df[column].astype(str)
+    for column in categorical:
+        df[column] = df[column].astype('category')
+    table = pa.Table.from_pandas(df, preserve_index=False)
+
+    # Fixed index width, so batches with different numbers of categories share one schema
+    types = {column: pa.dictionary(pa.int32(), pa.string()) for column in categorical}
+    types.update({column: pa.large_string() for column in TEXT_COLUMNS if column in table.column_names})
+    for column, type_ in types.items():
+        index = table.column_names.index(column)
+        table = table.set_column(index, column, table[column].cast(type_))
+    return table
+
+
+# Read a CSV or Parquet dataset, optionally only some of its columns
+def read_table(path, columns=None):
+    if is_parquet(path):
+        return pd.read_parquet(path, columns=columns)
+    return pd.read_csv(path, usecols=columns)
+
+
+# Write a whole DataFrame as CSV or Parquet
+def write_table(df, path):
+    if not is_parquet(path):
+        df.to_csv(path, index=False)
+        return
+
+    import pyarrow.parquet as pq
+
+    pq.write_table(_to_arrow(df, categorical_columns(df)), path)
+
+
+# CSV writer that takes one DataFrame batch at a time, so only the current batch is ever in memory
+class CsvBatchWriter:
+    def __init__(self, path):
+        self.file = open(path, 'w', newline='', encoding='utf-8')
+        self.header = True
+
+    def write(self, df):
+        df.to_csv(self.file, index=False, header=self.header)
+        self.header = False
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# Parquet writer with one row group per batch; the categorical columns are picked from the first batch
+class ParquetBatchWriter:
+    def __init__(self, path):
+        self.path = path
+        self.writer = None
+        self.categorical = None
+
+    def write(self, df):
+        import pyarrow.parquet as pq
+
+        if self.categorical is None:
+            self.categorical = categorical_columns(df)
+        table = _to_arrow(df, self.categorical)
+        if self.writer is None:
+            self.writer = pq.ParquetWriter(self.path, table.schema)
+        self.writer.write_table(table.cast(self.writer.schema))
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# Batch writer for `path`; pass parquet= to choose the format when the extension doesn't say (e.g. a .tmp file)
+def open_writer(path, parquet=None):
+    if parquet is None:
+        parquet = is_parquet(path)
+    return ParquetBatchWriter(path) if parquet else CsvBatchWriter(path)
+
+
+# Concatenate files written by the batch writers, in order, without loading any of them whole
+def concat_files(paths, output_file):
+    if is_parquet(output_file):
+        import pyarrow.parquet as pq
+
+        writer = None
+        for path in paths:
+            parquet_file = pq.ParquetFile(path)
+            if writer is None:
+                writer = pq.ParquetWriter(output_file, parquet_file.schema_arrow)
+            for group in range(parquet_file.num_row_groups):
+                writer.write_table(parquet_file.read_row_group(group).cast(writer.schema))
+        if writer is not None:
+            writer.close()
+        return
+
+    # CSV: copy the bytes, keeping only the first header
+    with open(output_file, 'wb') as out:
+        for i, path in enumerate(paths):
+            with open(path, 'rb') as f:
+                if i > 0:
+                    f.readline()
+                shutil.copyfileobj(f, out)
+
+
+# Convert an existing dataset, e.g. `python storage.py synthetic_data_large_with_cv.csv synthetic_data_large_with_cv.parquet`
+if __name__ == '__main__':
+    source, target = sys.argv[1:3]
+    write_table(read_table(source), target)
+    print(f"Converted {source} to {target}")
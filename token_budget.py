@@ -0,0 +1,125 @@
+import hashlib
+import json
+import os
+
+# Token counts of texts already seen, per tokenizer; override with AI_BIAS_TOKEN_COUNTS
+DEFAULT_COUNTS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'token_counts.json')
+
+# Characters per token for models without a local tokenizer (Gemini, GPT4All), and for OpenAI models
+# when tiktoken or its encoding files aren't available (e.g. offline without a cached copy)
+CHARS_PER_TOKEN = 4
+
+# USD per million (input, output) tokens of the hosted models the scripts use; local models are free
+PRICES = {
+    'gpt-4o': (5.00, 15.00),
+    'gpt-4o-2024-05-13': (5.00, 15.00),
+    'gpt-4o-mini-2024-07-18': (0.15, 0.60),
+    'gpt-3.5-turbo-0125': (0.50, 1.50),
+    'gpt-4-turbo-2024-04-09': (10.00, 30.00),
+    'gemini-1.5-flash': (0.075, 0.30),
+}
+
+# Price factor of requests sent through the OpenAI Batch API
+BATCH_DISCOUNT = 0.5
+
+
+# tiktoken encoding of an OpenAI model as (name, encode), or (None, None) if it can't be loaded
+def _load_encoding(model):
+    try:
+        import tiktoken
+
+        encoding = tiktoken.encoding_for_model(model)
+        encoding.encode('')  # Fails here when the encoding file can't be fetched
+    except Exception:
+        return None, None
+    return encoding.name, encoding.encode_ordinary
+
+
+# Token counts for prompts and cover letters. OpenAI models are counted exactly with tiktoken and
+# every count is cached on disk by a hash of the text, so each cover letter is only tokenized once
+# across runs; other models are estimated from the length.
+class TokenCounter:
+    def __init__(self, path=None):
+        self.path = path or os.environ.get('AI_BIAS_TOKEN_COUNTS', DEFAULT_COUNTS_FILE)
+        self.counts = {}
+        if os.path.exists(self.path):
+            with open(self.path, encoding='utf-8') as f:
+                self.counts = json.load(f)
+        self.encodings = {}
+        self.changed = False
+
+    # Name of the tokenizer used for a model ('estimate' when there's no exact one)
+    def tokenizer(self, provider, model):
+        return self._encoding(provider, model)[0] or 'estimate'
+
+    def _encoding(self, provider, model):
+        if provider != 'openai':
+            return None, None
+        if model not in self.encodings:
+            self.encodings[model] = _load_encoding(model)
+        return self.encodings[model]
+
+    # Number of tokens of `text` for this provider and model; cache=False for texts that won't come
+    # up again (e.g. replies), which are counted without being stored
+    def count(self, provider, model, text, cache=True):
+        name, encode = self._encoding(provider, model)
+        if encode is None:
+            return -(-len(text) // CHARS_PER_TOKEN)
+        if not cache:
+            return len(encode(text))
+        counts = self.counts.setdefault(name, {})
+        key = hashlib.sha1(text.encode('utf-8')).hexdigest()
+        if key not in counts:
+            counts[key] = len(encode(text))
+            self.changed = True
+        return counts[key]
+
+    def save(self):
+        if not self.changed:
+            return
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self.counts, f)
+        os.replace(tmp, self.path)
+        self.changed = False
+
+
+# Projected requests, tokens and cost of a run per model, from its jobs before they are sent
+class RunPlan:
+    def __init__(self, rate_limits=None, discount=1.0):
+        self.rate_limits = rate_limits or {}
+        self.discount = discount
+        self.models = {}
+
+    def add(self, model, input_tokens, output_tokens, requests=1):
+        totals = self.models.setdefault(model, [0, 0, 0])
+        totals[0] += requests
+        totals[1] += input_tokens
+        totals[2] += output_tokens
+
+    def add_jobs(self, jobs):
+        for job in jobs:
+            self.add(job.model, job.input_tokens, job.output_tokens)
+
+    # Cost in USD (None for a model without a known price) of `label`'s requests to `model`
+    def cost(self, label, model=None):
+        requests, input_tokens, output_tokens = self.models[label]
+        price = PRICES.get(model or label)
+        if price is None:
+            return None
+        return (input_tokens * price[0] + output_tokens * price[1]) / 1e6 * self.discount
+
+    # One line per model, e.g. '[gpt-4o] 1,200 requests, 960,000 input + 19,200 output tokens (at most),
+    # ~$5.09, 33 min at 30,000 tpm'; `models` maps labels to model names where they differ
+    def summary(self, models=None):
+        lines = []
+        for label, (requests, input_tokens, output_tokens) in self.models.items():
+            cost = self.cost(label, (models or {}).get(label))
+            line = (f"[{label}] {requests:,} requests, {input_tokens:,} input + {output_tokens:,} output tokens "
+                    f"(at most), {'cost unknown' if cost is None else f'~${cost:,.2f}'}")
+            if label in self.rate_limits:
+                rpm, tpm = self.rate_limits[label]
+                minutes = max(requests / rpm, (input_tokens + output_tokens) / tpm)
+                line += f", {minutes:,.0f} min at {rpm:,} rpm / {tpm:,} tpm"
+            lines.append(line)
+        return '\n'.join(lines)
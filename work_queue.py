@@ -0,0 +1,62 @@
+from collections import deque
+
+
+# Values the scripts use for "not processed yet"; a score of 0 means no score could be extracted
+EMPTY_VALUES = (None, '', 0)
+
+
+# Set of (row, model, task) units that already have a usable result in the journal
+def completed_units(records):
+    done = set()
+    for record in records:
+        if record.get('model') is None:
+            continue
+        key = (record['row'], record['model'], record['task'])
+        if record['value'] in EMPTY_VALUES:
+            done.discard(key)
+        else:
+            done.add(key)
+    return done
+
+
+# Latest per-row value of a model-independent task (such as the chosen cv_2_id) from the journal
+def row_values(records, task):
+    values = {}
+    for record in records:
+        if record['task'] == task and record.get('model') is None:
+            values[record['row']] = record['value']
+    return values
+
+
+# Every (row, model, task) unit a run is responsible for; `rows_by_task` maps each task to the rows it applies to
+def plan_units(rows_by_task, models):
+    return [(row, model, task)
+            for task, rows in rows_by_task.items()
+            for row in rows
+            for model in models]
+
+
+# Work queue holding only the units that the persisted state doesn't already cover,
+# ordered by row so output fills in from the top like the sequential scripts did
+class WorkQueue:
+    def __init__(self, plan, records):
+        done = completed_units(records)
+        self.total = len(plan)
+        self.pending = deque(sorted((unit for unit in plan if unit not in done), key=lambda u: u[0]))
+
+    def __len__(self):
+        return len(self.pending)
+
+    def __iter__(self):
+        while self.pending:
+            yield self.pending.popleft()
+
+    # Pending units grouped by row, for scripts that process a whole row at a time
+    def by_row(self):
+        rows = {}
+        for row, model, task in self:
+            rows.setdefault(row, []).append((model, task))
+        return rows
+
+    def summary(self):
+        return f"{len(self.pending)} of {self.total} units pending ({self.total - len(self.pending)} already done)"